@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Image derivatives
+# Downscaled copies of uploaded images, stored next to the blob under
+# <sha256>.<size>.webp (or .jpg when Pillow lacks WebP). This runs in the
+# worker processes of task_manager's derivative pool, so it lives in its own
+# module: functions defined in the Streamlit script cannot be pickled by
+# reference into another process. It works on bytes only; reading and writing
+# blob storage stays in the app process.
+import io
+from PIL import Image, ImageOps, features
+
+# Longest side in pixels; thumb is shown in chat bubbles, medium on notices
+DERIVATIVE_SIZES = {'thumb': 512, 'medium': 1600}
+
+if features.check('webp'):
+    DERIVATIVE_FORMAT, DERIVATIVE_EXTENSION = 'WEBP', 'webp'
+    DERIVATIVE_SAVE_OPTIONS = {'quality': 82, 'method': 4}
+else:
+    DERIVATIVE_FORMAT, DERIVATIVE_EXTENSION = 'JPEG', 'jpg'
+    DERIVATIVE_SAVE_OPTIONS = {'quality': 82, 'optimize': True, 'progressive': True}
+
+def render_derivatives(data, sizes=None):
+    # Returns {size: encoded bytes}; {} if data is not a readable image
+    sizes = list(sizes or DERIVATIVE_SIZES)
+    rendered = {}
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEGs decode at a reduced scale directly (no-op for other formats)
+            largest = max(DERIVATIVE_SIZES[size] for size in sizes)
+            image.draft('RGB', (largest, largest))
+            # Phone photos are stored sideways with an EXIF orientation tag
+            image = ImageOps.exif_transpose(image)
+            has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            if has_alpha and DERIVATIVE_FORMAT == 'WEBP':
+                image = image.convert('RGBA')
+            else:
+                image = image.convert('RGB')
+            for size in sizes:
+                max_side = DERIVATIVE_SIZES[size]
+                derivative = image.copy()
+                derivative.thumbnail((max_side, max_side), Image.LANCZOS)
+                out = io.BytesIO()
+                derivative.save(out, DERIVATIVE_FORMAT, **DERIVATIVE_SAVE_OPTIONS)
+                rendered[size] = out.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return {}
+    return rendered
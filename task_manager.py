@@ -1,59 +1,849 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
-
-# Configure page for wide layout - FORCE SIDEBAR EXPANDED
-st.set_page_config(
-    page_title="SRJ Strips Task Manager",
-    layout="wide",
-    initial_sidebar_state="expanded",
-    menu_items=None  # Hide default Streamlit menu
-)
-
+from streamlit import runtime as st_runtime
 import psycopg2
-from psycopg2.extras import DictCursor
+from psycopg2 import extensions as pg_extensions
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import DictCursor, execute_values
 import bcrypt
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+import hashlib
+import hmac
+import http.server
+import io
+import itertools
+import mimetypes
 import os
+import queue
+import shutil
+import socket
+import tempfile
 import uuid
 import pandas as pd
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+import pyarrow as pa
+import pyarrow.parquet as pq
 import random
+import argparse
+import json
+import multiprocessing
+import logging
+import select
+import sys
+import threading
+import time
+import traceback
+import urllib.parse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from streamlit_option_menu import option_menu
+from image_derivatives import DERIVATIVE_EXTENSION, DERIVATIVE_SIZES, render_derivatives
 
-def get_db_connection():
+logger = logging.getLogger(__name__)
+
+def _get_db_config():
     # Use Streamlit secrets for production (Streamlit Cloud)
     # Fallback to local values for local development
     try:
-        # Try to get from Streamlit secrets (for Streamlit Cloud)
-        db_config = st.secrets["postgres"]
-        
-        # Check if connection string is provided (for Vercel Prisma/Postgres)
-        if "connection_string" in db_config or "postgresql_url" in db_config:
-            # Use connection string directly (Vercel format)
-            connection_string = db_config.get("connection_string") or db_config.get("postgresql_url")
-            return psycopg2.connect(connection_string)
-        
-        # Otherwise use individual parameters
-        return psycopg2.connect(
-            host=db_config.get("host", "localhost"),
-            database=db_config.get("database", "hrms_db"),
-            user=db_config.get("user", "postgres"),
-            password=db_config.get("password", "Abhi122103"),
-            port=int(db_config.get("port", 5432))
-        )
+        return st.secrets["postgres"]
     except (KeyError, AttributeError, FileNotFoundError):
-        # Fallback to local development values
-        return psycopg2.connect(
-            host='localhost',
-            database='hrms_db',
-            user='postgres',
-            password='Abhi122103',
-            port=5432
-        )
+        return {}
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
+def _get_connect_kwargs():
+    db_config = _get_db_config()
+    
+    # Check if connection string is provided (for Vercel Prisma/Postgres)
+    if "connection_string" in db_config or "postgresql_url" in db_config:
+        # Use connection string directly (Vercel format)
+        return {'dsn': db_config.get("connection_string") or db_config.get("postgresql_url")}
+    
+    # Otherwise use individual parameters (defaults match local development)
+    return {
+        'host': db_config.get("host", "localhost"),
+        'database': db_config.get("database", "hrms_db"),
+        'user': db_config.get("user", "postgres"),
+        'password': db_config.get("password", "Abhi122103"),
+        'port': int(db_config.get("port", 5432))
+    }
+
+class PooledConnection:
+    # Handed out by get_db_connection(). Everything is delegated to the real
+    # psycopg2 connection, except close() which returns it to the pool.
+    def __init__(self, db_pool, conn, checkout_id):
+        self._pool = db_pool
+        self._conn = conn
+        self._checkout_id = checkout_id
+    
+    def __getattr__(self, name):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already returned to the pool")
+        return getattr(conn, name)
+    
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+    
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.putconn(conn, self._checkout_id)
+    
+    def __del__(self):
+        # Never returned (early return or exception between checkout and close).
+        # Only queue it here: __del__ can run while the pool lock is held.
+        conn = self.__dict__.get('_conn')
+        if conn is not None:
+            self._conn = None
+            self._pool._leaked.append((conn, self._checkout_id))
+
+class ConnectionPool:
+    # Process-wide pool shared by every Streamlit session (see get_db_pool()).
+    # Connections are checked out with getconn() and go back on close().
+    # A reaper thread closes connections idle for longer than idle_timeout
+    # (keeping min_size open) and reports checkouts held past leak_timeout.
+    def __init__(self, connect_kwargs, min_size=1, max_size=10, idle_timeout=300,
+                 checkout_timeout=30, leak_timeout=120, ping_after=60):
+        self.connect_kwargs = connect_kwargs
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.leak_timeout = leak_timeout
+        self.ping_after = ping_after
+        self.leaked_total = 0
+        self._idle = []  # (conn, returned_at), most recently returned last
+        self._in_use = {}  # checkout_id -> [conn, checked_out_at, stack, reported]
+        self._size = 0
+        self._next_id = 0
+        self._leaked = deque()
+        self._cond = threading.Condition()
+        
+        for _ in range(min_size):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+        
+        self._reaper = threading.Thread(target=self._reap_forever, name="db-pool-reaper", daemon=True)
+        self._reaper.start()
+    
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+    
+    def getconn(self):
+        self._collect_leaked()
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            conn = None
+            with self._cond:
+                while conn is None:
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        if conn.closed:
+                            self._size -= 1
+                            conn = None
+                        continue
+                    if self._size < self.max_size:
+                        # Reserve the slot, open the connection outside the lock
+                        self._size += 1
+                        returned_at = None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise pg_pool.PoolError(
+                            f"connection pool exhausted ({self.max_size} connections in use)"
+                        )
+                    self._cond.wait(remaining)
+            
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._discard(None)
+                    raise
+            elif time.monotonic() - returned_at > self.ping_after and not self._is_alive(conn):
+                # Managed Postgres (Neon, Supabase) drops idle sockets server-side
+                self._discard(conn)
+                continue
+            return self._checkout(conn)
+    
+    def _checkout(self, conn):
+        with self._cond:
+            self._next_id += 1
+            checkout_id = self._next_id
+            stack = ''.join(traceback.format_stack(limit=8)[:-2])
+            self._in_use[checkout_id] = [conn, time.monotonic(), stack, False]
+        return PooledConnection(self, conn, checkout_id)
+    
+    def _is_alive(self, conn):
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def _discard(self, conn):
+        if conn is not None and not conn.closed:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+    
+    def putconn(self, conn, checkout_id):
+        with self._cond:
+            self._in_use.pop(checkout_id, None)
+        
+        if conn.closed:
+            self._discard(conn)
+            return
+        
+        try:
+            # Never hand a connection with an open (or aborted) transaction to the next session
+            if conn.info.transaction_status != pg_extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def _collect_leaked(self):
+        while self._leaked:
+            try:
+                conn, checkout_id = self._leaked.popleft()
+            except IndexError:
+                break
+            with self._cond:
+                entry = self._in_use.get(checkout_id)
+                self.leaked_total += 1
+            logger.warning(
+                "Database connection was never returned to the pool; reclaimed it. Checked out at:\n%s",
+                entry[2] if entry else "<unknown>"
+            )
+            self.putconn(conn, checkout_id)
+    
+    def reap(self):
+        self._collect_leaked()
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            keep = []
+            # Oldest first; always keep min_size connections open
+            for conn, returned_at in self._idle:
+                if now - returned_at > self.idle_timeout and self._size - len(expired) > self.min_size:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, returned_at))
+            self._idle = keep
+            
+            held_too_long = []
+            for checkout_id, entry in self._in_use.items():
+                if not entry[3] and now - entry[1] > self.leak_timeout:
+                    entry[3] = True
+                    held_too_long.append((checkout_id, now - entry[1], entry[2]))
+        
+        for conn in expired:
+            self._discard(conn)
+        for checkout_id, held_for, stack in held_too_long:
+            logger.warning(
+                "Database connection #%s checked out for %.0fs without being returned. Checked out at:\n%s",
+                checkout_id, held_for, stack
+            )
+    
+    def _reap_forever(self):
+        while True:
+            time.sleep(min(30, max(1, self.idle_timeout / 2)))
+            try:
+                self.reap()
+            except Exception:
+                logger.exception("Connection pool reaper failed")
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'leaked_total': self.leaked_total,
+            }
+
+@st.cache_resource
+def get_db_pool():
+    # One pool per process, shared by all browser sessions
+    db_config = _get_db_config()
+    return ConnectionPool(
+        _get_connect_kwargs(),
+        min_size=int(db_config.get("pool_min_size", 1)),
+        max_size=int(db_config.get("pool_max_size", 10)),
+        idle_timeout=float(db_config.get("pool_idle_timeout", 300)),
+        checkout_timeout=float(db_config.get("pool_checkout_timeout", 30)),
+        leak_timeout=float(db_config.get("pool_leak_timeout", 120))
+    )
+
+def get_db_connection():
+    # Checks a connection out of the shared pool; conn.close() gives it back
+    return get_db_pool().getconn()
+
+# Blob storage backends
+# Attachment content lives behind a small interface so the app can keep it on
+# local disk (the default) or in an S3-compatible bucket (AWS S3, MinIO, R2...),
+# which survives redeploys and is shared by every app node. Keys look like
+# "<first two hex digits>/<sha256>" (plus ".<size>.<ext>" for image
+# derivatives); objects are only ever written whole.
+#   put(key, fileobj)               upload from a binary file, chunked/multipart
+#   get(key) -> bytes
+#   stream(key, start=0, end=None)  iterator of chunks, end inclusive
+#   delete(key)                     a missing key is not an error
+#   stat(key)                       {'key', 'size', 'modified'} or None
+#   list(prefix)                    stat dicts for the keys under prefix, in key order
+#   location(key)                   what the attachment tables record as file_path
+# Missing objects raise FileNotFoundError and other failures OSError, whatever
+# the backend.
+
+STORAGE_CHUNK_SIZE = 1024 * 1024
+
+class LocalBlobStorage:
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+    
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+    
+    def put(self, key, fileobj):
+        # Through a temporary file so readers never see a partial object
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                shutil.copyfileobj(fileobj, f, STORAGE_CHUNK_SIZE)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def get(self, key):
+        with open(self._path(key), "rb") as f:
+            return f.read()
+    
+    def stream(self, key, start=0, end=None):
+        f = open(self._path(key), "rb")
+        
+        def chunks():
+            with f:
+                f.seek(start)
+                remaining = None if end is None else end - start + 1
+                while remaining is None or remaining > 0:
+                    chunk = f.read(STORAGE_CHUNK_SIZE if remaining is None else min(STORAGE_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    yield chunk
+        return chunks()
+    
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+    
+    def stat(self, key):
+        try:
+            st_result = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        return {'key': key, 'size': st_result.st_size, 'modified': st_result.st_mtime}
+    
+    def list(self, prefix):
+        # Keys are listed one directory deep, which is all the key layout uses
+        directory = self._path(prefix.rstrip('/'))
+        try:
+            names = sorted(os.listdir(directory))
+        except FileNotFoundError:
+            return
+        for name in names:
+            try:
+                st_result = os.stat(os.path.join(directory, name))
+            except FileNotFoundError:
+                continue
+            yield {'key': prefix + name, 'size': st_result.st_size, 'modified': st_result.st_mtime}
+    
+    def location(self, key):
+        return self._path(key)
+
+class S3BlobStorage:
+    # Large uploads go up as multipart uploads in multipart_chunk_size parts;
+    # reads and Range requests are streamed from get_object.
+    def __init__(self, bucket, prefix="blobs/", endpoint_url=None, region_name=None,
+                 access_key_id=None, secret_access_key=None,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunk_size=8 * 1024 * 1024):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.exceptions import BotoCoreError, ClientError
+        except ImportError as e:
+            raise RuntimeError("The s3 storage backend needs boto3: pip install boto3") from e
+        self.bucket = bucket
+        self.prefix = prefix
+        self._client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region_name,
+                                    aws_access_key_id=access_key_id,
+                                    aws_secret_access_key=secret_access_key)
+        self._transfer_config = TransferConfig(multipart_threshold=multipart_threshold,
+                                               multipart_chunksize=multipart_chunk_size)
+        self._errors = (BotoCoreError, ClientError)
+    
+    def _call(self, method, key, **kwargs):
+        try:
+            return method(Bucket=self.bucket, Key=self.prefix + key, **kwargs)
+        except self._errors as e:
+            code = getattr(e, 'response', {}).get('Error', {}).get('Code')
+            if code in ('404', 'NoSuchKey', 'NotFound'):
+                raise FileNotFoundError(key) from e
+            raise OSError(f"S3 {method.__name__} {key}: {e}") from e
+    
+    def put(self, key, fileobj):
+        try:
+            self._client.upload_fileobj(fileobj, self.bucket, self.prefix + key, Config=self._transfer_config)
+        except self._errors as e:
+            raise OSError(f"S3 upload {key}: {e}") from e
+    
+    def get(self, key):
+        return self._call(self._client.get_object, key)['Body'].read()
+    
+    def stream(self, key, start=0, end=None):
+        kwargs = {}
+        if start or end is not None:
+            kwargs['Range'] = f"bytes={start}-{'' if end is None else end}"
+        body = self._call(self._client.get_object, key, **kwargs)['Body']
+        
+        def chunks():
+            try:
+                yield from body.iter_chunks(STORAGE_CHUNK_SIZE)
+            finally:
+                body.close()
+        return chunks()
     
+    def delete(self, key):
+        self._call(self._client.delete_object, key)
+    
+    def stat(self, key):
+        try:
+            head = self._call(self._client.head_object, key)
+        except FileNotFoundError:
+            return None
+        return {'key': key, 'size': head['ContentLength'], 'modified': head['LastModified'].timestamp()}
+    
+    def list(self, prefix):
+        # S3 returns keys in UTF-8 binary order, one page at a time
+        paginator = self._client.get_paginator('list_objects_v2')
+        try:
+            for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+                for obj in page.get('Contents', []):
+                    yield {'key': obj['Key'][len(self.prefix):], 'size': obj['Size'],
+                           'modified': obj['LastModified'].timestamp()}
+        except self._errors as e:
+            raise OSError(f"S3 list {prefix}: {e}") from e
+    
+    def location(self, key):
+        return f"s3://{self.bucket}/{self.prefix}{key}"
+
+@st.cache_resource
+def get_blob_storage():
+    # One backend per process, chosen by the [storage] secrets section
+    try:
+        config = dict(st.secrets["storage"])
+    except (KeyError, AttributeError, FileNotFoundError):
+        config = {}
+    backend = config.pop("backend", "local")
+    if backend == "local":
+        return LocalBlobStorage(config.get("path", BLOB_DIR))
+    if backend == "s3":
+        return S3BlobStorage(**config)
+    raise ValueError(f"Unknown storage backend {backend!r} (expected 'local' or 's3')")
+
+# Content-addressed attachment store
+# Task, notice and chat attachments all point at one object per distinct
+# content, stored in blob storage under <first two hex digits>/<sha256>. The
+# blobs table counts references from the three attachment tables (kept by
+# triggers, see migration 7); a blob whose count drops to zero is reclaimed by
+# the FileDeletionWorker. A blob row is locked (upsert) before its object is
+# written and the reclaimer only takes rows it can lock, so the two never race.
+
+BLOB_DIR = os.path.join("uploads", "blobs")
+
+ATTACHMENT_TABLES = ('task_attachments', 'notice_attachments', 'chat_attachments')
+
+def blob_key(sha256):
+    return f"{sha256[:2]}/{sha256}"
+
+def derivative_key(sha256, size):
+    return f"{blob_key(sha256)}.{size}.{DERIVATIVE_EXTENSION}"
+
+def blob_path(sha256):
+    # Local layout of the default backend; migration 7 folds legacy uploads here
+    return os.path.join(BLOB_DIR, sha256[:2], sha256)
+
+def _hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+def store_upload(cur, uploaded_file):
+    # Returns (sha256, file_path). Must run in the transaction that inserts the
+    # attachment row: the upsert keeps the blob locked until that commits.
+    data = uploaded_file.getbuffer()
+    sha256 = hashlib.sha256(data).hexdigest()
+    cur.execute('''
+        INSERT INTO blobs (sha256, size) VALUES (%s, %s)
+        ON CONFLICT (sha256) DO UPDATE SET size = EXCLUDED.size
+    ''', (sha256, len(data)))
+    storage = get_blob_storage()
+    key = blob_key(sha256)
+    # Write-once: concurrent writers of the same content produce the same object
+    if storage.stat(key) is None:
+        uploaded_file.seek(0)
+        storage.put(key, uploaded_file)
+    if (getattr(uploaded_file, 'type', None) or '').startswith('image/'):
+        queue_image_derivatives(sha256)
+    return sha256, storage.location(key)
+
+# Image derivatives
+# Thumbnail and medium copies of image blobs (see image_derivatives.py) are made
+# right after upload: a thread reads the original from storage, a process pool
+# resizes it and the thread stores the results, so pages show a few hundred KB
+# instead of the original photo. Blobs uploaded before derivatives existed are
+# queued the first time a page asks for them.
+
+@st.cache_resource
+def get_derivative_pool():
+    # spawn, not fork: the app process runs threads (pool reaper, listeners)
+    return {
+        'processes': ProcessPoolExecutor(max_workers=min(2, os.cpu_count() or 1),
+                                         mp_context=multiprocessing.get_context('spawn')),
+        'threads': ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-derivatives"),
+        'pending': set(),
+        'ready': {},  # sha256 -> True once stored, False if not a readable image
+        'lock': threading.Lock(),
+    }
+
+def _make_image_derivatives(derivative_pool, storage, sha256):
+    data = storage.get(blob_key(sha256))
+    rendered = derivative_pool['processes'].submit(render_derivatives, data).result()
+    for size, content in rendered.items():
+        storage.put(derivative_key(sha256, size), io.BytesIO(content))
+    return bool(rendered)
+
+def queue_image_derivatives(sha256):
+    derivative_pool = get_derivative_pool()
+    with derivative_pool['lock']:
+        if sha256 in derivative_pool['pending']:
+            return
+        derivative_pool['pending'].add(sha256)
+    
+    def done(future):
+        with derivative_pool['lock']:
+            derivative_pool['pending'].discard(sha256)
+            if future.exception() is None:
+                derivative_pool['ready'][sha256] = future.result()
+        if future.exception() is not None:
+            logger.warning("Image derivatives failed for blob %s: %s", sha256, future.exception())
+    
+    derivative_pool['threads'].submit(_make_image_derivatives, derivative_pool, get_blob_storage(),
+                                      sha256).add_done_callback(done)
+
+def image_derivative_source(att, size):
+    # Link to (or content of, see attachment_media()) a derivative of an image
+    # attachment, or None while it is being made (or if the blob is not a
+    # readable image)
+    sha256 = att.get('blob_sha256')
+    if not sha256:
+        return None
+    derivative_pool = get_derivative_pool()
+    with derivative_pool['lock']:
+        ready = derivative_pool['ready'].get(sha256)
+        pending = sha256 in derivative_pool['pending']
+    if ready:
+        return attachment_media(att, size)
+    if ready is False or pending:
+        return None
+    storage = get_blob_storage()
+    if storage.stat(derivative_key(sha256, size)) is not None:
+        with derivative_pool['lock']:
+            derivative_pool['ready'][sha256] = True
+        return attachment_media(att, size)
+    if storage.stat(blob_key(sha256)) is not None:
+        queue_image_derivatives(sha256)
+    return None
+
+# Attachment file server
+# Pages never read attachments: they emit links to a small HTTP server running
+# in a thread of the app process (see get_file_server()), which streams the blob
+# in chunks and supports Range requests, ETag revalidation and long-lived
+# caching. Links are HMAC-signed over (sha256, filename, expiry), so only users
+# who were shown an attachment can fetch it. Expiries are rounded to the TTL
+# window so a link stays the same across reruns and the browser cache hits.
+# Finished export jobs are served the same way under /exports/.
+# The server needs its own port the browser can reach, configured as [files]
+# public_url. Without it (e.g. Streamlit Cloud, which exposes only the app's
+# port) files go through the app instead: downloads are buttons that read the
+# blob when clicked, previews and audio are read inline (see attachment_media()).
+
+FILE_LINK_TTL = 12 * 3600
+
+INLINE_CONTENT_TYPES = ('image/', 'audio/', 'video/', 'application/pdf')
+
+def _get_file_server_config():
+    try:
+        files_config = st.secrets["files"]
+    except (KeyError, AttributeError, FileNotFoundError):
+        files_config = {}
+    port = int(files_config.get("port", 8502))
+    return {
+        'host': files_config.get("host", "0.0.0.0"),
+        'port': port,
+        # None: no address the browser can reach, so no file server (see get_file_server())
+        'public_url': files_config["public_url"].rstrip("/") if files_config.get("public_url") else None,
+    }
+
+@st.cache_resource
+def _get_file_link_key():
+    # Replicas behind a load balancer must share [files] secret; otherwise each
+    # process signs with its own random key and only honours its own links
+    try:
+        secret = st.secrets["files"]["secret"]
+    except (KeyError, AttributeError, FileNotFoundError):
+        secret = None
+    return secret.encode() if secret else os.urandom(32)
+
+def _sign_file_link(subject, filename, expires, size=''):
+    # subject is the blob's sha256, or "export/<job id>" for an export file
+    message = f"{subject}\n{size}\n{filename}\n{expires}".encode()
+    return hmac.new(_get_file_link_key(), message, hashlib.sha256).hexdigest()
+
+def attachment_url(att, size=None):
+    # Link to an attachment row (or to one of its image derivatives), or None
+    # without a file server or if its content never made it into the blob
+    # store (a legacy row whose file was already missing)
+    sha256 = att.get('blob_sha256')
+    if not sha256 or _get_file_server_config()['public_url'] is None:
+        return None
+    get_file_server()
+    expires = (int(time.time()) // FILE_LINK_TTL + 2) * FILE_LINK_TTL
+    filename = att['filename'] or sha256
+    params = {'e': expires, 's': _sign_file_link(sha256, filename, expires, size or '')}
+    if size:
+        params['v'] = size
+    query = urllib.parse.urlencode(params)
+    return (f"{_get_file_server_config()['public_url']}/files/{sha256}/"
+            f"{urllib.parse.quote(filename, safe='')}?{query}")
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _read_blob(key):
+    # Keys are content-addressed, so a cached copy never goes stale
+    return get_blob_storage().get(key)
+
+def attachment_media(att, size=None):
+    # Source for st.image/st.audio: a file server link, or without the server
+    # the content itself; None if the object is missing
+    url = attachment_url(att, size)
+    if url:
+        return url
+    sha256 = att['blob_sha256']
+    try:
+        return _read_blob(derivative_key(sha256, size) if size else blob_key(sha256))
+    except OSError:
+        return None
+
+def show_attachment_download(att, label, key):
+    # A link to the file server, or a download button that reads the blob only
+    # when it is clicked
+    url = attachment_url(att)
+    if url:
+        st.link_button(label, url)
+        return
+    storage = get_blob_storage()
+    sha256 = att['blob_sha256']
+    filename = att['filename'] or sha256
+    st.download_button(label, data=lambda: storage.get(blob_key(sha256)), file_name=filename,
+                       mime=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+                       key=key, on_click="ignore")
+
+def _parse_byte_range(header, size):
+    # Single "bytes=start-end" / "bytes=start-" / "bytes=-suffix" range as an
+    # inclusive (start, end), None to ignore the header, or False if unsatisfiable
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, _, end = header[len("bytes="):].strip().partition("-")
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        elif end:
+            start, end = max(size - int(end), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start >= size or start > end:
+        return False
+    return start, end
+
+class AttachmentRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "TaskManagerFiles/1.0"
+    
+    def do_HEAD(self):
+        self._serve(send_body=False)
+    
+    def do_GET(self):
+        self._serve(send_body=True)
+    
+    def _serve(self, send_body):
+        url = urllib.parse.urlsplit(self.path)
+        parts = url.path.split("/")
+        query = urllib.parse.parse_qs(url.query)
+        # /files/<sha256>/<name> for attachments, /exports/<job id>/<name> for
+        # finished export jobs
+        if len(parts) != 4 or not ((parts[1] == "files" and len(parts[2]) == 64)
+                                   or (parts[1] == "exports" and parts[2].isdigit())):
+            return self.send_error(404)
+        filename = urllib.parse.unquote(parts[3])
+        try:
+            expires = int(query['e'][0])
+            signature = query['s'][0]
+        except (KeyError, ValueError):
+            return self.send_error(403)
+        variant = query.get('v', [''])[0]
+        if variant and (parts[1] != "files" or variant not in DERIVATIVE_SIZES):
+            return self.send_error(404)
+        subject = parts[2] if parts[1] == "files" else f"export/{parts[2]}"
+        if not hmac.compare_digest(signature, _sign_file_link(subject, filename, expires, variant)):
+            return self.send_error(403)
+        if expires < time.time():
+            return self.send_error(410, "Link expired, reload the page")
+        
+        storage = self.server.storage
+        if parts[1] == "exports":
+            key = export_key(int(parts[2]), filename)
+            etag = f'"export-{parts[2]}"'
+        elif variant:
+            key = derivative_key(parts[2], variant)
+            filename = f"{os.path.splitext(filename)[0]}.{DERIVATIVE_EXTENSION}"
+            etag = f'"{parts[2]}-{variant}"'
+        else:
+            key = blob_key(parts[2])
+            etag = f'"{parts[2]}"'
+        try:
+            blob = storage.stat(key)
+        except OSError:
+            return self.send_error(502)
+        if blob is None:
+            return self.send_error(404)
+        size = blob['size']
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        disposition = "inline" if content_type.startswith(INLINE_CONTENT_TYPES) else "attachment"
+        
+        if etag in self.headers.get("If-None-Match", ""):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        
+        byte_range = _parse_byte_range(self.headers.get("Range"), size)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if byte_range is None:
+            start, end = 0, size - 1
+        else:
+            start, end = byte_range
+        try:
+            chunks = storage.stream(key, start, end) if send_body and size else iter(())
+        except FileNotFoundError:
+            return self.send_error(404)
+        except OSError:
+            return self.send_error(502)
+        
+        if byte_range is None:
+            self.send_response(200)
+        else:
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("Content-Disposition",
+                         f"{disposition}; filename*=UTF-8''{urllib.parse.quote(filename, safe='')}")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        # Blobs and exports never change, so the link is cacheable for as long as it is valid
+        self.send_header("Cache-Control", f"private, max-age={max(int(expires - time.time()), 0)}, immutable")
+        self.send_header("X-Content-Type-Options", "nosniff")
+        self.end_headers()
+        
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # Browsers drop media connections once they have enough buffered
+            pass
+        except OSError as e:
+            # Headers are gone already; the client sees a short response
+            logger.warning("Attachment file server: reading %s failed: %s", key, e)
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close:
+                close()
+    
+    def log_message(self, format, *args):
+        logger.debug("file server: %s - %s", self.address_string(), format % args)
+
+@st.cache_resource
+def get_file_server():
+    # One server thread per process. If the port is taken (another replica on
+    # the same host) links are still emitted and that process serves them.
+    config = _get_file_server_config()
+    if config['public_url'] is None:
+        logger.warning("[files] public_url is not set: attachment file server not started, "
+                       "files are delivered through the app instead")
+        return None
+    try:
+        server = http.server.ThreadingHTTPServer((config['host'], config['port']), AttachmentRequestHandler)
+    except OSError as e:
+        logger.warning("Attachment file server not started on port %s: %s", config['port'], e)
+        return None
+    server.daemon_threads = True
+    server.storage = get_blob_storage()
+    threading.Thread(target=server.serve_forever, name="attachment-file-server", daemon=True).start()
+    return server
+
+# Schema migrations
+# Each step runs once per database, in order, inside its own transaction, and
+# its version is recorded in schema_version. Append new steps to MIGRATIONS;
+# never edit a step that has already shipped. A step may return a callable to
+# run once its transaction has committed (e.g. removing files it replaced).
+
+# Key for pg_advisory_lock so replicas starting together migrate one at a time
+SCHEMA_MIGRATION_LOCK_ID = 7261001
+
+def _migration_001_baseline(cur):
     # Check if users table exists and has all required columns
     cur.execute('''
         SELECT column_name FROM information_schema.columns 
@@ -163,13 +953,11 @@ def init_db():
     
     # Insert default departments if not exists
     default_departments = ['IT', 'HR', 'Finance', 'Operations', 'Sales', 'Marketing', 'Administration']
-    for dept in default_departments:
-        cur.execute('INSERT INTO departments (name) VALUES (%s) ON CONFLICT (name) DO NOTHING', (dept,))
+    cur.execute('INSERT INTO departments (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING', (default_departments,))
     
     # Insert default designations if not exists
     default_designations = ['Manager', 'Senior Manager', 'Executive', 'Senior Executive', 'Associate', 'Senior Associate', 'Administrator']
-    for desg in default_designations:
-        cur.execute('INSERT INTO designations (name) VALUES (%s) ON CONFLICT (name) DO NOTHING', (desg,))
+    cur.execute('INSERT INTO designations (name) SELECT unnest(%s::text[]) ON CONFLICT (name) DO NOTHING', (default_designations,))
     
     # Notice Board table
     cur.execute('''
@@ -186,129 +974,2540 @@ def init_db():
     
     # Notice attachments table
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS notice_attachments (
-            id SERIAL PRIMARY KEY,
-            notice_id INTEGER REFERENCES notices(id) ON DELETE CASCADE,
-            filename TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            uploaded_by TEXT REFERENCES users(username) ON DELETE SET NULL
-        )
-    ''')
-    
-    # Check if old chats table exists without chat_id
+        CREATE TABLE IF NOT EXISTS notice_attachments (
+            id SERIAL PRIMARY KEY,
+            notice_id INTEGER REFERENCES notices(id) ON DELETE CASCADE,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_size INTEGER,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            uploaded_by TEXT REFERENCES users(username) ON DELETE SET NULL
+        )
+    ''')
+    
+    # Check if old chats table exists without chat_id
+    cur.execute('''
+        SELECT column_name FROM information_schema.columns 
+        WHERE table_name='chats' AND column_name='chat_id'
+    ''')
+    has_chat_id = cur.fetchone()
+    
+    # Migrate to new schema if needed
+    if not has_chat_id:
+        cur.execute('DROP TABLE IF EXISTS chats CASCADE')
+        cur.execute('DROP TABLE IF EXISTS chat_participants CASCADE')
+        cur.execute('DROP TABLE IF EXISTS chat_conversations CASCADE')
+    
+    # Chat conversations table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS chat_conversations (
+            id SERIAL PRIMARY KEY,
+            chat_name TEXT,
+            chat_type TEXT NOT NULL CHECK (chat_type IN ('individual', 'group', 'all')),
+            created_by TEXT REFERENCES users(username) ON DELETE SET NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            join_link TEXT UNIQUE
+        )
+    ''')
+    
+    # Chat participants table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS chat_participants (
+            id SERIAL PRIMARY KEY,
+            chat_id INTEGER REFERENCES chat_conversations(id) ON DELETE CASCADE,
+            username TEXT REFERENCES users(username) ON DELETE CASCADE,
+            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(chat_id, username)
+        )
+    ''')
+    
+    # Chats table for team communication (messages)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS chats (
+            id SERIAL PRIMARY KEY,
+            chat_id INTEGER REFERENCES chat_conversations(id) ON DELETE CASCADE,
+            sender_username TEXT REFERENCES users(username) ON DELETE SET NULL,
+            message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Chat attachments table
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS chat_attachments (
+            id SERIAL PRIMARY KEY,
+            chat_message_id INTEGER REFERENCES chats(id) ON DELETE CASCADE,
+            filename TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            file_type TEXT NOT NULL,
+            file_size INTEGER,
+            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            uploaded_by TEXT REFERENCES users(username) ON DELETE SET NULL
+        )
+    ''')
+    
+    cur.execute('SELECT * FROM users WHERE username=%s', ('admin',))
+    if not cur.fetchone():
+        hashed_pw = bcrypt.hashpw('admin'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        cur.execute('''
+            INSERT INTO users (username, password, employee_id, first_name, last_name, department, designation, is_admin, is_director) 
+            VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE, FALSE)
+        ''', ('admin', hashed_pw, '000000000001', 'Admin', 'User', 'Administration', 'Administrator'))
+    
+    # Create default "ALL" chat conversation
+    cur.execute('SELECT * FROM chat_conversations WHERE chat_type=%s', ('all',))
+    if not cur.fetchone():
+        cur.execute('''
+            INSERT INTO chat_conversations (chat_name, chat_type, created_by)
+            VALUES (%s, %s, %s)
+            RETURNING id
+        ''', ('General Chat (All Users)', 'all', 'admin'))
+        all_chat_id = cur.fetchone()[0]
+        
+        # Add all existing users to "ALL" chat
+        cur.execute('''
+            INSERT INTO chat_participants (chat_id, username)
+            SELECT %s, username FROM users
+            ON CONFLICT DO NOTHING
+        ''', (all_chat_id,))
+
+def _migration_002_hot_path_indexes(cur):
+    # Only primary keys and UNIQUE constraints were indexed before
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_task_assignments_username ON task_assignments (username, task_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_task_attachments_task_id ON task_attachments (task_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_chats_chat_id_created_at ON chats (chat_id, created_at, id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_chat_attachments_message_id ON chat_attachments (chat_message_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_chat_participants_username ON chat_participants (username, chat_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_notices_active_created_at ON notices (is_active, created_at DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_notice_attachments_notice_id ON notice_attachments (notice_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_department ON users (department)')
+
+def _migration_003_task_list_keyset(cur):
+    # The Task List pages with a keyset over (priority rank, created_at DESC, id DESC),
+    # so the rank is stored and created_at can no longer be NULL
+    cur.execute('''
+        ALTER TABLE tasks ADD COLUMN IF NOT EXISTS priority_rank SMALLINT GENERATED ALWAYS AS (
+            CASE priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END
+        ) STORED
+    ''')
+    cur.execute('UPDATE tasks SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL')
+    cur.execute('ALTER TABLE tasks ALTER COLUMN created_at SET NOT NULL')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_tasks_list_order ON tasks (priority_rank, created_at DESC, id DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_list_order ON tasks (status, priority_rank, created_at DESC, id DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_tasks_due_date ON tasks (due_date)')
+
+def _migration_004_cache_versions(cur):
+    # One counter per cached result set, bumped by triggers on the tables it is
+    # computed from; readers compare it to decide whether a cached result is
+    # still valid. The bump is a deferred constraint trigger, so it runs once
+    # per transaction at commit: the counter row is locked only while that
+    # transaction commits, not for the length of (say) an import chunk
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS cache_versions (
+            name TEXT PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    ''')
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION bump_cache_version() RETURNS trigger AS $$
+        BEGIN
+            IF current_setting('cache_versions.' || TG_ARGV[0], TRUE) IS DISTINCT FROM 'bumped' THEN
+                UPDATE cache_versions SET version = version + 1 WHERE name = TG_ARGV[0];
+                PERFORM set_config('cache_versions.' || TG_ARGV[0], 'bumped', TRUE);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    cur.execute("INSERT INTO cache_versions (name) VALUES ('user_task_counts') ON CONFLICT (name) DO NOTHING")
+    
+    # Users Management: users joined to their open/completed/total task counts.
+    # Constraint triggers are row-level and cannot fire on TRUNCATE, which gets
+    # a plain statement trigger (it locks the whole table anyway)
+    for table, events in [('task_assignments', 'INSERT OR UPDATE OR DELETE'),
+                          ('tasks', 'UPDATE OF status OR DELETE'),
+                          ('users', 'INSERT OR UPDATE OR DELETE')]:
+        cur.execute(f'DROP TRIGGER IF EXISTS {table}_user_task_counts ON {table}')
+        cur.execute(f'''
+            CREATE CONSTRAINT TRIGGER {table}_user_task_counts
+            AFTER {events} ON {table}
+            DEFERRABLE INITIALLY DEFERRED
+            FOR EACH ROW EXECUTE FUNCTION bump_cache_version('user_task_counts')
+        ''')
+        cur.execute(f'DROP TRIGGER IF EXISTS {table}_user_task_counts_truncate ON {table}')
+        cur.execute(f'''
+            CREATE TRIGGER {table}_user_task_counts_truncate
+            AFTER TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_cache_version('user_task_counts')
+        ''')
+
+def _migration_005_chat_cursor(cur):
+    # Chat views fetch only recent messages (on idx_chats_chat_id_created_at),
+    # and reload in full when a chat's history_version moves (a clear)
+    cur.execute('ALTER TABLE chat_conversations ADD COLUMN IF NOT EXISTS history_version INTEGER NOT NULL DEFAULT 0')
+
+def _migration_006_chat_notify(cur):
+    # Push chat changes to the listener thread (see ChatEventHub): new messages
+    # carry their id, a clear bumps history_version and carries none
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION notify_chat_event() RETURNS trigger AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'chats' THEN
+                PERFORM pg_notify('chat_events', json_build_object('chat_id', NEW.chat_id, 'message_id', NEW.id)::text);
+            ELSE
+                PERFORM pg_notify('chat_events', json_build_object('chat_id', NEW.id, 'message_id', NULL)::text);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    cur.execute('DROP TRIGGER IF EXISTS chats_notify ON chats')
+    cur.execute('''
+        CREATE TRIGGER chats_notify AFTER INSERT ON chats
+        FOR EACH ROW EXECUTE FUNCTION notify_chat_event()
+    ''')
+    cur.execute('DROP TRIGGER IF EXISTS chat_conversations_notify ON chat_conversations')
+    cur.execute('''
+        CREATE TRIGGER chat_conversations_notify AFTER UPDATE OF history_version ON chat_conversations
+        FOR EACH ROW EXECUTE FUNCTION notify_chat_event()
+    ''')
+
+def _migration_007_blob_store(cur):
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS blobs (
+            sha256 TEXT PRIMARY KEY,
+            size BIGINT NOT NULL,
+            ref_count INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_blobs_unreferenced ON blobs (sha256) WHERE ref_count <= 0')
+    
+    # Statement-level triggers with transition tables: a chat clear that drops
+    # 50k attachment rows costs one grouped UPDATE of blobs, not 50k
+    cur.execute('''
+        CREATE OR REPLACE FUNCTION blob_ref_counts() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                UPDATE blobs b SET ref_count = b.ref_count + d.refs
+                FROM (SELECT blob_sha256, COUNT(*) AS refs FROM new_rows
+                      WHERE blob_sha256 IS NOT NULL GROUP BY blob_sha256) d
+                WHERE b.sha256 = d.blob_sha256;
+            END IF;
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                UPDATE blobs b SET ref_count = b.ref_count - d.refs
+                FROM (SELECT blob_sha256, COUNT(*) AS refs FROM old_rows
+                      WHERE blob_sha256 IS NOT NULL GROUP BY blob_sha256) d
+                WHERE b.sha256 = d.blob_sha256;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    ''')
+    for table in ATTACHMENT_TABLES:
+        cur.execute(f'ALTER TABLE {table} ADD COLUMN IF NOT EXISTS blob_sha256 TEXT REFERENCES blobs(sha256)')
+        cur.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_blob ON {table} (blob_sha256)')
+        for event, transition in [('INSERT', 'NEW TABLE AS new_rows'),
+                                  ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+                                  ('DELETE', 'OLD TABLE AS old_rows')]:
+            trigger = f'{table}_blob_refs_{event.lower()}'
+            cur.execute(f'DROP TRIGGER IF EXISTS {trigger} ON {table}')
+            cur.execute(f'''
+                CREATE TRIGGER {trigger} AFTER {event} ON {table}
+                REFERENCING {transition}
+                FOR EACH STATEMENT EXECUTE FUNCTION blob_ref_counts()
+            ''')
+    
+    # Fold existing uploads into the store. Files are hard-linked (or copied)
+    # in; the originals are only removed after this step has committed.
+    folded = {}
+    for table in ATTACHMENT_TABLES:
+        cur.execute(f'SELECT id, file_path FROM {table} WHERE blob_sha256 IS NULL')
+        updates = []
+        for row_id, path in cur.fetchall():
+            if path not in folded:
+                if not path or not os.path.isfile(path):
+                    continue  # Nothing on disk to fold; the row keeps its old path
+                sha256, size = _hash_file(path)
+                target = blob_path(sha256)
+                if not os.path.exists(target):
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+                    try:
+                        os.link(path, tmp_path)
+                    except OSError:
+                        shutil.copyfile(path, tmp_path)
+                    os.replace(tmp_path, target)
+                cur.execute('INSERT INTO blobs (sha256, size) VALUES (%s, %s) ON CONFLICT (sha256) DO NOTHING',
+                            (sha256, size))
+                folded[path] = sha256
+            updates.append((row_id, folded[path], blob_path(folded[path])))
+        if updates:
+            execute_values(cur, f'''
+                UPDATE {table} AS a SET blob_sha256 = v.sha256, file_path = v.file_path
+                FROM (VALUES %s) AS v (id, sha256, file_path)
+                WHERE a.id = v.id
+            ''', updates)
+    
+    def remove_folded_originals():
+        for path, sha256 in folded.items():
+            if os.path.abspath(path) != os.path.abspath(blob_path(sha256)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    logger.warning("Could not remove %s after moving it into the blob store", path)
+    return remove_folded_originals
+
+def _migration_008_import_jobs(cur):
+    # Bulk imports commit chunk by chunk; the job row records how far they got
+    # so an interrupted import resumes after the last committed chunk
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id SERIAL PRIMARY KEY,
+            created_by TEXT REFERENCES users(username) ON DELETE SET NULL,
+            filename TEXT NOT NULL,
+            file_sha256 TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running' CHECK (status IN ('running', 'completed', 'failed')),
+            total_rows INTEGER,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            created_count INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_file ON import_jobs (created_by, file_sha256, id DESC)')
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS import_job_errors (
+            job_id INTEGER NOT NULL REFERENCES import_jobs(id) ON DELETE CASCADE,
+            row_number INTEGER NOT NULL,
+            column_name TEXT NOT NULL,
+            reason TEXT NOT NULL
+        )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_import_job_errors_job ON import_job_errors (job_id, row_number)')
+
+def _migration_009_import_fingerprints(cur):
+    # Imported tasks carry a fingerprint of title, description, due date and
+    # sorted assignees, so importing the same row again finds the task
+    # instead of duplicating it. Tasks created in the app have none.
+    cur.execute('ALTER TABLE tasks ADD COLUMN IF NOT EXISTS import_fingerprint TEXT')
+    cur.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_tasks_import_fingerprint ON tasks (import_fingerprint)
+        WHERE import_fingerprint IS NOT NULL
+    ''')
+    cur.execute('ALTER TABLE import_jobs ADD COLUMN IF NOT EXISTS updated_count INTEGER NOT NULL DEFAULT 0')
+    cur.execute('ALTER TABLE import_jobs ADD COLUMN IF NOT EXISTS unchanged_count INTEGER NOT NULL DEFAULT 0')
+
+def _migration_010_export_jobs(cur):
+    # Export queue shared by every worker (see ExportWorker)
+    cur.execute('''
+        CREATE TABLE IF NOT EXISTS export_jobs (
+            id SERIAL PRIMARY KEY,
+            created_by TEXT REFERENCES users(username) ON DELETE SET NULL,
+            kind TEXT NOT NULL,
+            params JSONB NOT NULL DEFAULT '{}',
+            export_format TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'completed', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            size BIGINT,
+            error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            heartbeat_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    ''')
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_export_jobs_pending ON export_jobs (id) WHERE status IN ('queued', 'running')")
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_created_by ON export_jobs (created_by, id DESC)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_export_jobs_finished_at ON export_jobs (finished_at) WHERE finished_at IS NOT NULL')
+
+MIGRATIONS = [
+    (1, "baseline schema", _migration_001_baseline),
+    (2, "indexes for hot lookups", _migration_002_hot_path_indexes),
+    (3, "keyset pagination for the task list", _migration_003_task_list_keyset),
+    (4, "cache version counters", _migration_004_cache_versions),
+    (5, "incremental chat fetch", _migration_005_chat_cursor),
+    (6, "chat change notifications", _migration_006_chat_notify),
+    (7, "content-addressed attachment store", _migration_007_blob_store),
+    (8, "resumable bulk import jobs", _migration_008_import_jobs),
+    (9, "idempotent bulk import fingerprints", _migration_009_import_fingerprints),
+    (10, "background export jobs", _migration_010_export_jobs),
+]
+
+def run_migrations(conn):
+    cur = conn.cursor()
+    # Session-level lock: survives the per-step commits below
+    cur.execute('SELECT pg_advisory_lock(%s)', (SCHEMA_MIGRATION_LOCK_ID,))
+    try:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        
+        # Read under the lock: another replica may have just finished migrating
+        cur.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+        current_version = cur.fetchone()[0]
+        
+        for version, description, migrate in MIGRATIONS:
+            if version <= current_version:
+                continue
+            try:
+                after_commit = migrate(cur)
+                cur.execute('INSERT INTO schema_version (version, description) VALUES (%s, %s)', (version, description))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if after_commit:
+                after_commit()
+    finally:
+        cur.execute('SELECT pg_advisory_unlock(%s)', (SCHEMA_MIGRATION_LOCK_ID,))
+        conn.commit()
+        cur.close()
+
+@st.cache_resource
+def ensure_schema():
+    # Runs once per process; later sessions get the cached result without
+    # touching the database. A failure is not cached, so the next session retries.
+    conn = get_db_connection()
+    try:
+        run_migrations(conn)
+    finally:
+        conn.close()
+    
+    # Create uploads directories if they don't exist
+    os.makedirs(BLOB_DIR, exist_ok=True)
+    return True
+
+# Hot queries
+# Statements that run on (almost) every rerun. They live here so the pages
+# and check_query_plans() execute exactly the same SQL.
+
+USER_DEPARTMENT_SQL = 'SELECT department FROM users WHERE username=%s'
+
+# Batched lookups used by the Task List: one query for the whole page of tasks
+TASK_ASSIGNEES_BATCH_SQL = '''
+    SELECT task_id, username, assigned_at
+    FROM task_assignments
+    WHERE task_id = ANY(%s)
+    ORDER BY task_id, assigned_at
+'''
+
+TASK_ATTACHMENTS_BATCH_SQL = '''
+    SELECT id, task_id, filename, file_path, file_type, file_size, uploaded_at, uploaded_by, blob_sha256
+    FROM task_attachments
+    WHERE task_id = ANY(%s)
+    ORDER BY task_id, uploaded_at DESC
+'''
+
+USERS_WITH_TASK_COUNTS_SQL = '''
+    SELECT u.username, u.employee_id, u.first_name, u.last_name, u.department, u.designation,
+           u.is_admin, u.is_director,
+           COALESCE(c.open_tasks, 0) AS open_tasks,
+           COALESCE(c.completed_tasks, 0) AS completed_tasks,
+           COALESCE(c.total_tasks, 0) AS total_tasks
+    FROM users u
+    LEFT JOIN (
+        SELECT ta.username,
+               COUNT(*) FILTER (WHERE t.status <> 'completed') AS open_tasks,
+               COUNT(*) FILTER (WHERE t.status = 'completed') AS completed_tasks,
+               COUNT(*) AS total_tasks
+        FROM task_assignments ta
+        JOIN tasks t ON t.id = ta.task_id
+        GROUP BY ta.username
+    ) c ON c.username = u.username
+    ORDER BY u.is_admin DESC, u.is_director DESC, u.first_name, u.last_name
+'''
+
+CACHE_VERSION_SQL = 'SELECT version FROM cache_versions WHERE name = %s'
+
+USER_ASSIGNED_TASKS_SQL = '''
+    SELECT t.* FROM tasks t
+    INNER JOIN task_assignments ta ON t.id = ta.task_id
+    WHERE ta.username = %s
+    ORDER BY 
+        CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
+        t.created_at DESC
+'''
+
+# Chat sidebar: every conversation of a user with its display label (the other
+# participant's full name for individual chats) and last message, most recent first
+USER_CHATS_SQL = '''
+    SELECT cc.id, cc.chat_name, cc.chat_type, cc.created_at,
+           COALESCE(NULLIF(TRIM(CONCAT_WS(' ', other.first_name, other.last_name)), ''), other.username) AS other_name,
+           LEFT(last_msg.message, 60) AS last_message,
+           last_msg.sender_username AS last_sender,
+           last_msg.created_at AS last_message_at
+    FROM chat_participants cp
+    JOIN chat_conversations cc ON cc.id = cp.chat_id
+    LEFT JOIN LATERAL (
+        SELECT u.username, u.first_name, u.last_name
+        FROM chat_participants op
+        JOIN users u ON u.username = op.username
+        WHERE op.chat_id = cc.id AND op.username <> cp.username
+        LIMIT 1
+    ) other ON cc.chat_type = 'individual'
+    LEFT JOIN LATERAL (
+        SELECT c.message, c.sender_username, c.created_at
+        FROM chats c
+        WHERE c.chat_id = cc.id
+        ORDER BY c.created_at DESC, c.id DESC
+        LIMIT 1
+    ) last_msg ON TRUE
+    WHERE cp.username = %s
+    ORDER BY COALESCE(last_msg.created_at, cc.created_at) DESC, cc.id DESC
+'''
+
+CHAT_PARTICIPANTS_SQL = '''
+    SELECT u.username, u.first_name, u.last_name FROM chat_participants cp
+    JOIN users u ON cp.username = u.username
+    WHERE cp.chat_id = %s AND cp.username != %s
+'''
+
+CHAT_MESSAGES_SQL = '''
+    SELECT c.*, u.first_name, u.last_name, u.department, u.designation
+    FROM chats c
+    LEFT JOIN users u ON c.sender_username = u.username
+    WHERE c.chat_id = %s
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT %s
+'''
+
+# "Load older": the page before the oldest loaded message, keyset on (created_at, id)
+CHAT_OLDER_MESSAGES_SQL = '''
+    SELECT c.*, u.first_name, u.last_name, u.department, u.designation
+    FROM chats c
+    LEFT JOIN users u ON c.sender_username = u.username
+    WHERE c.chat_id = %s AND (c.created_at, c.id) < (%s, %s)
+    ORDER BY c.created_at DESC, c.id DESC
+    LIMIT %s
+'''
+
+CHAT_NEW_MESSAGES_SQL = '''
+    SELECT c.*, u.first_name, u.last_name, u.department, u.designation
+    FROM chats c
+    LEFT JOIN users u ON c.sender_username = u.username
+    WHERE c.chat_id = %s AND c.created_at >= %s
+    ORDER BY c.created_at, c.id
+    LIMIT %s
+'''
+
+# Attachments of a whole window of messages in one round trip
+CHAT_MESSAGE_ATTACHMENTS_SQL = '''
+    SELECT * FROM chat_attachments
+    WHERE chat_message_id = ANY(%s)
+    ORDER BY chat_message_id, id
+'''
+
+ACTIVE_NOTICES_SQL = '''
+    SELECT n.*, u.first_name, u.last_name, u.department
+    FROM notices n
+    LEFT JOIN users u ON n.created_by = u.username
+    WHERE n.is_active = TRUE
+    ORDER BY n.created_at DESC
+'''
+
+NOTICE_ATTACHMENTS_SQL = '''
+    SELECT id, filename, file_path, file_type, file_size, blob_sha256
+    FROM notice_attachments
+    WHERE notice_id=%s
+    ORDER BY uploaded_at
+'''
+
+def load_task_details(cur, task_ids):
+    # Assignees and attachment metadata for a list of tasks in two round-trips,
+    # returned as {task_id: [rows]} so render loops never query per task
+    assignees_by_task = {}
+    attachments_by_task = {}
+    if not task_ids:
+        return assignees_by_task, attachments_by_task
+    
+    cur.execute(TASK_ASSIGNEES_BATCH_SQL, (list(task_ids),))
+    for row in cur.fetchall():
+        assignees_by_task.setdefault(row['task_id'], []).append(row)
+    
+    cur.execute(TASK_ATTACHMENTS_BATCH_SQL, (list(task_ids),))
+    for row in cur.fetchall():
+        attachments_by_task.setdefault(row['task_id'], []).append(row)
+    
+    return assignees_by_task, attachments_by_task
+
+def get_cache_version(cur, name):
+    cur.execute(CACHE_VERSION_SQL, (name,))
+    row = cur.fetchone()
+    return row[0] if row else 0
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def load_users_with_task_counts(version):
+    # version comes from cache_versions('user_task_counts'); it changes whenever
+    # an assignment, a task status or a user changes, which misses the cache
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        cur.execute(USERS_WITH_TASK_COUNTS_SQL)
+        rows = [dict(row) for row in cur.fetchall()]
+        cur.close()
+        conn.rollback()
+    finally:
+        conn.close()
+    return rows
+
+# Chat message buffer
+# Each session keeps the recent messages of the open chat in memory with a
+# high-water mark (the newest created_at it has seen). A rerun asks for rows
+# from CHAT_CURSOR_OVERLAP before the mark and appends the ones it does not
+# have yet: created_at is the start of the sending transaction, and a message
+# whose attachments are still uploading commits after later, quicker ones, so
+# neither its id nor its created_at is past a mark taken in between. The
+# overlap must outlast the slowest send. The window is reloaded in full when
+# the chat is switched or its history was cleared (history_version changed).
+# Older pages requested with "Load older messages" are kept in the same buffer
+# ahead of the window, so scrolling back never re-reads them.
+
+CHAT_BUFFER_SIZE = 100
+CHAT_CURSOR_OVERLAP = timedelta(minutes=5)
+
+def _attach_chat_files(cur, buffer, rows):
+    if rows:
+        cur.execute(CHAT_MESSAGE_ATTACHMENTS_SQL, ([row['id'] for row in rows],))
+        for att in cur.fetchall():
+            buffer['attachments'].setdefault(att['chat_message_id'], []).append(dict(att))
+
+def chat_timeline(buffer):
+    return [*buffer['history'], *buffer['messages']]
+
+def load_chat_messages(cur, chat):
+    # Returns (messages oldest first, {message_id: [attachments]})
+    buffer = st.session_state.get('chat_buffer')
+    rows = None
+    if (buffer is not None and buffer['chat_id'] == chat['id']
+            and buffer['history_version'] == chat['history_version']):
+        since = buffer['cursor'] - CHAT_CURSOR_OVERLAP if buffer['cursor'] else datetime.min
+        cur.execute(CHAT_NEW_MESSAGES_SQL, (chat['id'], since, CHAT_BUFFER_SIZE))
+        rows = cur.fetchall()
+        if len(rows) >= CHAT_BUFFER_SIZE:
+            # A whole window arrived within the overlap; start over from the newest
+            rows = None
+        else:
+            seen = {msg['id'] for msg in buffer['messages']}
+            rows = [row for row in rows if row['id'] not in seen]
+    
+    if rows is None:
+        cur.execute(CHAT_MESSAGES_SQL, (chat['id'], CHAT_BUFFER_SIZE))
+        rows = cur.fetchall()
+        rows.reverse()
+        buffer = {
+            'chat_id': chat['id'],
+            'history_version': chat['history_version'],
+            'cursor': None,
+            'messages': deque(maxlen=CHAT_BUFFER_SIZE),
+            'history': deque(),
+            'has_older': len(rows) == CHAT_BUFFER_SIZE,
+            'attachments': {},
+        }
+        st.session_state.chat_buffer = buffer
+    
+    _attach_chat_files(cur, buffer, rows)
+    late = False
+    for row in rows:
+        if len(buffer['messages']) == CHAT_BUFFER_SIZE:
+            if buffer['history']:
+                # Older pages are on screen: keep the timeline continuous
+                buffer['history'].append(buffer['messages'][0])
+            else:
+                buffer['has_older'] = True
+        late = late or (buffer['cursor'] is not None and row['created_at'] <= buffer['cursor'])
+        buffer['messages'].append(dict(row))
+        buffer['cursor'] = row['created_at'] if buffer['cursor'] is None else max(buffer['cursor'], row['created_at'])
+    if late:
+        # A slow send committed after newer messages; show it where it belongs
+        buffer['messages'] = deque(sorted(buffer['messages'], key=lambda msg: (msg['created_at'], msg['id'])),
+                                   maxlen=CHAT_BUFFER_SIZE)
+    
+    # Forget the attachments of messages that fell out of the buffer
+    if len(buffer['attachments']) > len(buffer['messages']) + len(buffer['history']):
+        live_ids = {msg['id'] for msg in chat_timeline(buffer)}
+        buffer['attachments'] = {msg_id: atts for msg_id, atts in buffer['attachments'].items() if msg_id in live_ids}
+    
+    return chat_timeline(buffer), buffer['attachments']
+
+def load_older_chat_messages(cur, page_size=CHAT_BUFFER_SIZE):
+    # Prepends the page before the oldest loaded message to the session buffer
+    buffer = st.session_state.get('chat_buffer')
+    if buffer is None or not buffer['has_older']:
+        return
+    timeline = chat_timeline(buffer)
+    if not timeline:
+        buffer['has_older'] = False
+        return
+    oldest = timeline[0]
+    cur.execute(CHAT_OLDER_MESSAGES_SQL, (buffer['chat_id'], oldest['created_at'], oldest['id'], page_size))
+    rows = cur.fetchall()
+    _attach_chat_files(cur, buffer, rows)
+    buffer['history'].extendleft(dict(row) for row in rows)
+    buffer['has_older'] = len(rows) == page_size
+
+# Clear chat
+# Messages and their attachment rows are deleted in one statement that hands
+# back the blobs they referenced; blobs left without references are reclaimed
+# by the FileDeletionWorker so the rerun does not wait on thousands of unlinks.
+
+CLEAR_CHAT_SQL = '''
+    WITH deleted_messages AS (
+        DELETE FROM chats WHERE chat_id = %s{sender_clause} RETURNING id
+    )
+    DELETE FROM chat_attachments
+    WHERE chat_message_id IN (SELECT id FROM deleted_messages)
+    RETURNING blob_sha256
+'''
+
+def clear_chat_messages(conn, cur, chat_id, sender=None):
+    # Deletes every message of the chat (or only sender's) and returns the
+    # blobs that may have lost their last reference; commits before returning
+    params = [chat_id]
+    sender_clause = ''
+    if sender:
+        sender_clause = ' AND sender_username = %s'
+        params.append(sender)
+    try:
+        cur.execute(CLEAR_CHAT_SQL.format(sender_clause=sender_clause), params)
+        blob_ids = sorted({row[0] for row in cur.fetchall() if row[0]})
+        # Every open view of this chat reloads its message buffer
+        cur.execute('UPDATE chat_conversations SET history_version = history_version + 1 WHERE id = %s', (chat_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return blob_ids
+
+def reclaim_blobs_later(blob_ids):
+    # Hands blobs that may have dropped to zero references to the background
+    # worker and remembers the job so this session can show its progress
+    if blob_ids:
+        job_id = get_file_deletion_worker().submit(blob_ids)
+        st.session_state.setdefault('file_deletion_jobs', []).append(job_id)
+
+class FileDeletionWorker:
+    # One per process. Jobs are lists of blob ids, reclaimed in batches: each
+    # batch locks the rows still at zero references (SKIP LOCKED, so a blob an
+    # upload is re-using right now is left alone), unlinks their files and
+    # deletes the rows in one transaction. Unlink failures are retried with a
+    # growing delay; a missing file counts as done.
+    # progress() reports {'total', 'deleted', 'failed', 'done'} for a job.
+    def __init__(self, db_pool, storage, batch_size=200, max_attempts=5, retry_delay=2.0, keep_finished=3600):
+        self._pool = db_pool
+        self._storage = storage
+        self._batch_size = batch_size
+        self._max_attempts = max_attempts
+        self._retry_delay = retry_delay
+        self._keep_finished = keep_finished
+        self._queue = queue.Queue()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="file-deletion-worker", daemon=True)
+        self._thread.start()
+    
+    def submit(self, blob_ids):
+        job_id = uuid.uuid4().hex
+        now = time.monotonic()
+        with self._lock:
+            # Drop finished jobs nobody asked about for a while
+            for old_id in [j for j, job in self._jobs.items()
+                           if job['done'] and now - job['finished_at'] > self._keep_finished]:
+                del self._jobs[old_id]
+            self._jobs[job_id] = {'total': len(blob_ids), 'deleted': 0, 'failed': 0, 'done': False, 'finished_at': None}
+        self._queue.put((job_id, list(blob_ids)))
+        return job_id
+    
+    def progress(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+    
+    def _run(self):
+        while True:
+            job_id, blob_ids = self._queue.get()
+            try:
+                failed = self._reclaim(job_id, blob_ids)
+            except Exception:
+                logger.exception("File deletion job %s crashed", job_id)
+                failed = None
+            with self._lock:
+                job = self._jobs[job_id]
+                job['failed'] = job['total'] - job['deleted'] if failed is None else len(failed)
+                job['done'] = True
+                job['finished_at'] = time.monotonic()
+    
+    def _reclaim(self, job_id, blob_ids):
+        pending = blob_ids
+        for attempt in range(1, self._max_attempts + 1):
+            retry = []
+            for start in range(0, len(pending), self._batch_size):
+                batch = pending[start:start + self._batch_size]
+                failed = self._reclaim_batch(batch)
+                retry.extend(failed)
+                with self._lock:
+                    self._jobs[job_id]['deleted'] += len(batch) - len(failed)
+            if not retry:
+                return []
+            if attempt < self._max_attempts:
+                time.sleep(self._retry_delay * attempt)
+            pending = retry
+        logger.warning("Could not delete %d blob file(s) after %d attempts, e.g. %s",
+                       len(pending), self._max_attempts, self._storage.location(blob_key(pending[0])))
+        return pending
+    
+    def _reclaim_batch(self, batch):
+        # Returns the blob ids whose file could not be removed (kept for a retry)
+        conn = self._pool.getconn()
+        try:
+            return reclaim_blobs(conn, self._storage, batch)[1]
+        finally:
+            conn.close()
+
+def reclaim_blobs(conn, storage, blob_ids):
+    # Deletes the objects and rows of the given blobs that are still at zero
+    # references and not locked by an upload, in one transaction. Returns
+    # (removed, failed) blob ids; a missing file counts as removed.
+    cur = conn.cursor()
+    try:
+        cur.execute('''
+            SELECT sha256 FROM blobs
+            WHERE sha256 = ANY(%s) AND ref_count <= 0
+            FOR UPDATE SKIP LOCKED
+        ''', (list(blob_ids),))
+        removed = []
+        failed = []
+        for (sha256,) in cur.fetchall():
+            try:
+                for size in DERIVATIVE_SIZES:
+                    storage.delete(derivative_key(sha256, size))
+                storage.delete(blob_key(sha256))
+                removed.append(sha256)
+            except OSError:
+                failed.append(sha256)
+        if removed:
+            cur.execute('DELETE FROM blobs WHERE sha256 = ANY(%s)', (removed,))
+        conn.commit()
+        return removed, failed
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+@st.cache_resource
+def get_file_deletion_worker():
+    return FileDeletionWorker(get_db_pool(), get_blob_storage())
+
+def show_file_deletion_progress():
+    # Progress of this session's background deletions; finished jobs are shown
+    # once (as a warning if some files could not be removed) and then forgotten
+    job_ids = st.session_state.get('file_deletion_jobs')
+    if not job_ids:
+        return
+    worker = get_file_deletion_worker()
+    running = []
+    for job_id in job_ids:
+        job = worker.progress(job_id)
+        if job is None:
+            continue
+        if not job['done']:
+            running.append(job_id)
+            st.progress(job['deleted'] / job['total'],
+                        text=f"Removing attachment files in the background: {job['deleted']}/{job['total']}")
+        elif job['failed']:
+            st.warning(f"{job['failed']} attachment file(s) could not be removed from disk.")
+    st.session_state.file_deletion_jobs = running
+
+# Upload garbage collector
+# Mark-and-sweep reconciliation of blob storage and uploads/ with the database,
+# for what the reference counts cannot see on their own: blobs left at zero
+# references without a reclaim job (user deletion, ON DELETE CASCADE, a crash
+# before the worker ran), objects written by an upload whose transaction rolled
+# back, derivatives and .tmp files left behind, files outside the blob store,
+# and rows whose file is gone. Storage is listed one fan-out prefix at a time
+# and compared with the blobs rows in that sha256 range, so memory stays
+# bounded by one prefix, and deletions are throttled. Orphan objects are
+# adopted as zero-reference rows and go through reclaim_blobs(), so an upload
+# re-using the same content at that moment is never broken.
+# Run headless: `python task_manager.py gc-uploads [--delete]` (e.g. from cron).
+
+UPLOAD_ROOT = "uploads"
+
+LEGACY_ATTACHMENT_ROWS_SQL = {
+    table: f'''
+        SELECT id, file_path FROM {table}
+        WHERE blob_sha256 IS NULL AND id > %s
+        ORDER BY id LIMIT %s
+    '''
+    for table in ATTACHMENT_TABLES
+}
+
+def _classify_blob_file(name):
+    # (sha256, kind) for a name under a fan-out prefix; kind is 'blob', a
+    # derivative size, 'tmp' or None for anything the store does not write
+    sha256, _, rest = name.partition('.')
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256):
+        return None, None
+    if not rest:
+        return sha256, 'blob'
+    if rest.endswith('.tmp'):
+        return sha256, 'tmp'
+    size = rest.split('.')[0]
+    if size in DERIVATIVE_SIZES and rest == f"{size}.{DERIVATIVE_EXTENSION}":
+        return sha256, size
+    return None, None
+
+class UploadGarbageCollector:
+    # collect() returns {finding: count}; report(finding, detail) is called for
+    # every finding. Without delete=True nothing is changed.
+    def __init__(self, conn, storage, delete=False, grace_seconds=3600, batch_size=500,
+                 max_deletes_per_second=50, report=None):
+        self.conn = conn
+        self.storage = storage
+        self.delete = delete
+        self.grace_seconds = grace_seconds
+        self.batch_size = batch_size
+        self.max_deletes_per_second = max_deletes_per_second
+        self.report = report or (lambda finding, detail: None)
+        self.counts = {}
+        self._window_start = time.monotonic()
+        self._window_deletes = 0
+    
+    def collect(self):
+        self._now = time.time()
+        cur = self.conn.cursor()
+        try:
+            for prefix in (f'{i:02x}' for i in range(256)):
+                self._sweep_blob_prefix(cur, prefix)
+            self._sweep_legacy_files(cur)
+        finally:
+            self.conn.rollback()
+            cur.close()
+        return self.counts
+    
+    def _found(self, finding, detail):
+        self.counts[finding] = self.counts.get(finding, 0) + 1
+        self.report(finding, detail)
+    
+    def _throttle(self, deletes):
+        # Keeps deletions at max_deletes_per_second so a large sweep does not
+        # starve the app of I/O
+        if not self.max_deletes_per_second:
+            return
+        self._window_deletes += deletes
+        elapsed = time.monotonic() - self._window_start
+        budget = self._window_deletes / self.max_deletes_per_second
+        if budget > elapsed:
+            time.sleep(budget - elapsed)
+        if elapsed >= 1:
+            self._window_start = time.monotonic()
+            self._window_deletes = 0
+    
+    def _is_old(self, modified):
+        return self._now - modified >= self.grace_seconds
+    
+    def _sweep_blob_prefix(self, cur, prefix):
+        # Mark: the rows of this fan-out prefix...
+        cur.execute('''
+            SELECT sha256, ref_count FROM blobs
+            WHERE sha256 BETWEEN %s AND %s
+            ORDER BY sha256
+        ''', (prefix + '0' * 62, prefix + 'f' * 62))
+        ref_counts = dict(cur.fetchall())
+        self.conn.rollback()
+        
+        # ...and its objects
+        blob_files = set()
+        orphans = set()
+        for obj in self.storage.list(prefix + '/'):
+            sha256, kind = _classify_blob_file(obj['key'][len(prefix) + 1:])
+            if kind is None or sha256[:2] != prefix:
+                self._found('unknown file', self.storage.location(obj['key']))
+            elif kind == 'tmp':
+                if self._is_old(obj['modified']):
+                    self._found('stale temporary file', self.storage.location(obj['key']))
+                    if self.delete:
+                        self._remove(self.storage.delete, obj['key'])
+            else:
+                if kind == 'blob':
+                    blob_files.add(sha256)
+                if sha256 not in ref_counts and self._is_old(obj['modified']):
+                    orphans.add(sha256)
+        
+        # Sweep
+        for sha256 in sorted(orphans):
+            self._found('file without a blob row', self.storage.location(blob_key(sha256)))
+        for sha256, ref_count in ref_counts.items():
+            if ref_count <= 0:
+                self._found('unreferenced blob', self.storage.location(blob_key(sha256)))
+            elif sha256 not in blob_files:
+                self._found('blob row without a file',
+                            f"{self.storage.location(blob_key(sha256))} ({ref_count} attachment(s))")
+        if self.delete:
+            unreferenced = sorted(orphans) + sorted(sha for sha, count in ref_counts.items() if count <= 0)
+            for start in range(0, len(unreferenced), self.batch_size):
+                self._reclaim(cur, unreferenced[start:start + self.batch_size])
+    
+    def _reclaim(self, cur, batch):
+        # Orphan objects get a zero-reference row first (an upload of the same
+        # content either already holds that row and is skipped, or waits for
+        # this transaction and then writes the object again)
+        execute_values(cur, '''
+            INSERT INTO blobs (sha256, size, ref_count) VALUES %s
+            ON CONFLICT (sha256) DO NOTHING
+        ''', [(sha256, 0, 0) for sha256 in batch])
+        removed, failed = reclaim_blobs(self.conn, self.storage, batch)
+        for sha256 in failed:
+            self._found('could not delete', self.storage.location(blob_key(sha256)))
+        self._throttle(len(removed))
+    
+    def _remove(self, delete, target):
+        try:
+            delete(target)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self._found('could not delete', f"{target} ({e})")
+        self._throttle(1)
+    
+    def _sweep_legacy_files(self, cur):
+        # Attachment rows that never made it into the blob store: the local file
+        # they name is kept if it exists and reported missing otherwise. Every
+        # other file under uploads/ (outside a local blob store) is left over
+        # from before the store.
+        kept = set()
+        for table in ATTACHMENT_TABLES:
+            last_id = 0
+            while True:
+                cur.execute(LEGACY_ATTACHMENT_ROWS_SQL[table], (last_id, self.batch_size))
+                rows = cur.fetchall()
+                self.conn.rollback()
+                if not rows:
+                    break
+                for row_id, file_path in rows:
+                    if file_path and os.path.isfile(file_path):
+                        kept.add(os.path.abspath(file_path))
+                        self._found('attachment outside the blob store', f"{table} #{row_id}: {file_path}")
+                    else:
+                        self._found('attachment without a file', f"{table} #{row_id}: {file_path}")
+                last_id = rows[-1][0]
+        
+        blob_roots = {os.path.abspath(BLOB_DIR), os.path.abspath(getattr(self.storage, 'root', BLOB_DIR))}
+        for directory, subdirectories, files in os.walk(UPLOAD_ROOT):
+            subdirectories[:] = sorted(d for d in subdirectories
+                                       if os.path.abspath(os.path.join(directory, d)) not in blob_roots)
+            for name in sorted(files):
+                path = os.path.join(directory, name)
+                try:
+                    modified = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    continue
+                if os.path.abspath(path) in kept or not self._is_old(modified):
+                    continue
+                self._found('file without an attachment row', path)
+                if self.delete:
+                    self._remove(os.remove, path)
+
+# Chat live updates
+# The chats table NOTIFYs on every insert (migration 6). One listener thread
+# per process turns those events into per-chat counters, and each open chat
+# pane is a fragment that reruns on its own every CHAT_REFRESH_SECONDS. Such a
+# rerun compares the counter with the one it last rendered and only goes to
+# the database when its own chat changed; otherwise it redraws from the
+# session's message buffer. The rest of the page is never rerun by the timer.
+
+CHAT_NOTIFY_CHANNEL = 'chat_events'
+
+CHAT_REFRESH_SECONDS = 2
+
+class ChatEventHub:
+    def __init__(self, connect_kwargs, reconnect_delay=5, idle_check=60):
+        self._connect_kwargs = connect_kwargs
+        self._reconnect_delay = reconnect_delay
+        self._idle_check = idle_check
+        self._lock = threading.Lock()
+        self._versions = {}
+        # Bumped on every (re)connect: events may have been missed meanwhile,
+        # so every pane refreshes once
+        self._epoch = 0
+        self._thread = threading.Thread(target=self._listen, name="chat-event-listener", daemon=True)
+        self._thread.start()
+    
+    def version(self, chat_id):
+        with self._lock:
+            return (self._epoch, self._versions.get(chat_id, 0))
+    
+    def publish(self, chat_id):
+        with self._lock:
+            self._versions[chat_id] = self._versions.get(chat_id, 0) + 1
+    
+    def _listen(self):
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**self._connect_kwargs)
+                conn.set_isolation_level(pg_extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor()
+                cur.execute(f'LISTEN {CHAT_NOTIFY_CHANNEL}')
+                with self._lock:
+                    self._epoch += 1
+                
+                while True:
+                    if select.select([conn], [], [], self._idle_check) == ([], [], []):
+                        # Quiet for a while: make sure the connection is still alive
+                        cur.execute('SELECT 1')
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        try:
+                            self.publish(int(json.loads(notify.payload)['chat_id']))
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning("Ignoring malformed chat event: %r", notify.payload)
+            except Exception:
+                logger.exception("Chat event listener disconnected, retrying in %ss", self._reconnect_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(self._reconnect_delay)
+
+@st.cache_resource
+def get_chat_event_hub():
+    return ChatEventHub(_get_connect_kwargs())
+
+def show_chat_attachment(att):
+    # Only a link goes to the browser where there is a file server; see
+    # attachment_media() for how it works without one
+    key = f"chat_attachment_{att['id']}"
+    if not att.get('blob_sha256'):
+        st.caption(f"⚠️ File not found: {att['filename']}")
+    elif att['file_type'] == 'image':
+        thumb = image_derivative_source(att, 'thumb')
+        if thumb:
+            st.image(thumb, width=250)
+        else:
+            st.caption(f"🖼️ Preparing preview of {att['filename']}…")
+        show_attachment_download(att, "🔍 Open original", key)
+    elif att['file_type'] == 'audio':
+        audio = attachment_media(att)
+        if audio:
+            st.audio(audio, format='audio/mpeg')
+        else:
+            st.caption(f"⚠️ File not found: {att['filename']}")
+    elif att['file_type'] == 'pdf':
+        show_attachment_download(att, f"📄 {att['filename']}", key)
+    else:
+        show_attachment_download(att, f"📎 {att['filename']}", key)
+
+@st.fragment(run_every=CHAT_REFRESH_SECONDS)
+def show_chat_messages(chat, user, join_link_html):
+    # The page sets chat_pane_stale before calling this, so a full rerun always
+    # picks up new rows; timer reruns only do so when the hub saw an event
+    event_version = get_chat_event_hub().version(chat['id'])
+    buffer = st.session_state.get('chat_buffer')
+    if (st.session_state.pop('chat_pane_stale', False) or buffer is None
+            or buffer['chat_id'] != chat['id'] or buffer.get('event_version') != event_version):
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute('SELECT id, history_version FROM chat_conversations WHERE id=%s', (chat['id'],))
+            current = cur.fetchone()
+            if current is None:
+                st.info("Chat not found.")
+                return
+            messages, message_attachments = load_chat_messages(cur, current)
+            cur.close()
+            conn.rollback()
+        finally:
+            conn.close()
+        st.session_state.chat_buffer['event_version'] = event_version
+    else:
+        messages, message_attachments = chat_timeline(buffer), buffer['attachments']
+    
+    if st.session_state.chat_buffer['has_older']:
+        if st.button("⬆️ Load older messages", key=f"load_older_{chat['id']}"):
+            conn = get_db_connection()
+            try:
+                cur = conn.cursor(cursor_factory=DictCursor)
+                load_older_chat_messages(cur)
+                cur.close()
+                conn.rollback()
+            finally:
+                conn.close()
+            messages = chat_timeline(st.session_state.chat_buffer)
+    
+    show_file_deletion_progress()
+    
+    # Scrollable messages container - Fixed position
+    st.markdown(f'<div class="chat-messages-container">{join_link_html}', unsafe_allow_html=True)
+    
+    # Display messages in Telegram-like style
+    if messages:
+        for msg in messages:
+            attachments = message_attachments.get(msg['id'], [])
+            
+            is_own_message = msg['sender_username'] == user['username']
+            sender_name = f"{msg['first_name']} {msg['last_name']}" if msg['first_name'] else msg['sender_username']
+            timestamp = msg['created_at'].strftime('%H:%M') if msg['created_at'] else 'N/A'
+            
+            if is_own_message:
+                # Right-aligned message (own) - Telegram style
+                st.markdown(f'''
+                <div class="telegram-message-own">
+                    <div class="telegram-message-own-content">
+                        {msg['message'] or ''}
+                        <div class="telegram-message-time">{timestamp} ✓</div>
+                    </div>
+                </div>
+                ''', unsafe_allow_html=True)
+                
+                # Display attachments separately below message
+                for att in attachments:
+                    show_chat_attachment(att)
+            else:
+                # Left-aligned message (others) with avatar
+                sender_initials = ''.join([n[0].upper() for n in sender_name.split()[:2]]) if sender_name else 'U'
+                
+                st.markdown(f'''
+                <div class="telegram-message-other">
+                    <div class="telegram-avatar">{sender_initials}</div>
+                    <div class="telegram-message-other-content">
+                        <div class="telegram-message-sender">{sender_name}</div>
+                        {msg['message'] or ''}
+                        <div class="telegram-message-time">{timestamp}</div>
+                    </div>
+                </div>
+                ''', unsafe_allow_html=True)
+                
+                # Display attachments separately below message
+                for att in attachments:
+                    show_chat_attachment(att)
+    else:
+        st.info("No messages yet. Start the conversation!")
+    
+    # Close scrollable messages container
+    st.markdown('</div>', unsafe_allow_html=True)
+
+# Task List keyset pagination
+# Pages follow the list order (priority rank, newest first, id) and a cursor is
+# the (priority_rank, created_at, id) of the last row on the previous page, so
+# every page costs the same no matter how deep it is.
+
+TASK_PAGE_SIZES = [10, 25, 50, 100]
+
+PRIORITY_RANKS = {'urgent': 1, 'high': 2, 'medium': 3, 'low': 4}
+
+def build_task_list_query(filters, cursor, page_size, visible_to=None):
+    # filters may hold priority, status, due_from, due_to, assignee, department;
+    # visible_to limits the list to tasks assigned to that username
+    clauses = []
+    params = []
+    
+    if visible_to:
+        clauses.append('EXISTS (SELECT 1 FROM task_assignments ta WHERE ta.task_id = t.id AND ta.username = %s)')
+        params.append(visible_to)
+    if filters.get('priority'):
+        clauses.append('t.priority_rank = %s')
+        params.append(PRIORITY_RANKS[filters['priority']])
+    if filters.get('status'):
+        clauses.append('t.status = %s')
+        params.append(filters['status'])
+    if filters.get('due_from'):
+        clauses.append('t.due_date >= %s')
+        params.append(filters['due_from'])
+    if filters.get('due_to'):
+        clauses.append('t.due_date <= %s')
+        params.append(filters['due_to'])
+    if filters.get('assignee'):
+        clauses.append('EXISTS (SELECT 1 FROM task_assignments ta WHERE ta.task_id = t.id AND ta.username = %s)')
+        params.append(filters['assignee'])
+    if filters.get('department'):
+        clauses.append('''EXISTS (
+            SELECT 1 FROM task_assignments ta
+            JOIN users u ON u.username = ta.username
+            WHERE ta.task_id = t.id AND u.department = %s
+        )''')
+        params.append(filters['department'])
+    if cursor:
+        # Rank ascends while created_at and id descend, hence the split predicate
+        rank, created_at, task_id = cursor
+        clauses.append('(t.priority_rank > %s OR (t.priority_rank = %s AND (t.created_at, t.id) < (%s, %s)))')
+        params.extend([rank, rank, created_at, task_id])
+    
+    query = 'SELECT t.* FROM tasks t'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    # One extra row tells us whether there is a next page
+    query += ' ORDER BY t.priority_rank, t.created_at DESC, t.id DESC LIMIT %s'
+    params.append(page_size + 1)
+    return query, params
+
+def fetch_task_page(cur, filters, cursor, page_size, visible_to=None):
+    # Returns (tasks, next_cursor); next_cursor is None on the last page
+    cur.execute(*build_task_list_query(filters, cursor, page_size, visible_to))
+    rows = cur.fetchall()
+    if len(rows) <= page_size:
+        return rows, None
+    last = rows[page_size - 1]
+    return rows[:page_size], (last['priority_rank'], last['created_at'], last['id'])
+
+# Task overview grid
+# One query behind the Admin Dashboard task table, the Complete Task Overview
+# and the HOD department overview, so the three cannot drift apart. Assignees
+# (with designation) and attachment counts are aggregated in SQL, and the grid
+# pages with the same keyset cursor as the Task List, so a rerun only pulls the
+# visible window out of the database and into the browser.
+
+TASK_OVERVIEW_COLUMNS = [
+    "ID", "Title", "Description", "Priority", "Status", "Assigned To",
+    "Created", "Due Date", "Completed", "Attachments"
+]
+
+def _task_overview_where(filters):
+    # filters may hold created_on (date), created_month (any date in the month),
+    # assignee and department; department keeps tasks with an assignee there
+    clauses = []
+    params = []
+    if filters.get('created_on'):
+        clauses.append('t.created_at >= %s::date AND t.created_at < %s::date + 1')
+        params.extend([filters['created_on'], filters['created_on']])
+    if filters.get('created_month'):
+        clauses.append("t.created_at >= DATE_TRUNC('month', %s::timestamp) "
+                       "AND t.created_at < DATE_TRUNC('month', %s::timestamp) + INTERVAL '1 month'")
+        params.extend([filters['created_month'], filters['created_month']])
+    if filters.get('assignee'):
+        clauses.append('EXISTS (SELECT 1 FROM task_assignments ta WHERE ta.task_id = t.id AND ta.username = %s)')
+        params.append(filters['assignee'])
+    if filters.get('department'):
+        clauses.append('''EXISTS (
+            SELECT 1 FROM task_assignments ta
+            JOIN users u ON u.username = ta.username
+            WHERE ta.task_id = t.id AND u.department = %s
+        )''')
+        params.append(filters['department'])
+    return clauses, params
+
+def build_task_overview_query(filters, cursor=None, page_size=None):
+    # Without page_size the whole filtered set is returned (exports).
+    # With a department filter only that department's assignees are listed.
+    params = []
+    assignee_scope = ''
+    if filters.get('department'):
+        assignee_scope = ' AND u.department = %s'
+        params.append(filters['department'])
+    
+    clauses, where_params = _task_overview_where(filters)
+    params.extend(where_params)
+    if cursor:
+        rank, created_at, task_id = cursor
+        clauses.append('(t.priority_rank > %s OR (t.priority_rank = %s AND (t.created_at, t.id) < (%s, %s)))')
+        params.extend([rank, rank, created_at, task_id])
+    
+    query = f'''
+        SELECT t.id, t.title, t.desc, t.priority, t.status, t.priority_rank,
+               t.created_at, t.due_date, t.completed_at,
+               a.assigned_to, f.attachments
+        FROM tasks t
+        LEFT JOIN LATERAL (
+            SELECT STRING_AGG(u.username || ' (' || COALESCE(u.designation, '') || ')', ', '
+                              ORDER BY ta.assigned_at) AS assigned_to
+            FROM task_assignments ta
+            JOIN users u ON u.username = ta.username
+            WHERE ta.task_id = t.id{assignee_scope}
+        ) a ON TRUE
+        CROSS JOIN LATERAL (
+            SELECT COUNT(*) AS attachments FROM task_attachments WHERE task_id = t.id
+        ) f
+    '''
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    query += ' ORDER BY t.priority_rank, t.created_at DESC, t.id DESC'
+    if page_size:
+        query += ' LIMIT %s'
+        params.append(page_size + 1)
+    return query, params
+
+def count_task_overview(cur, filters):
+    clauses, params = _task_overview_where(filters)
+    query = 'SELECT COUNT(*) AS count FROM tasks t'
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    cur.execute(query, params)
+    return cur.fetchone()['count']
+
+def fetch_task_overview_page(cur, filters, cursor, page_size):
+    # Returns (rows, next_cursor) like fetch_task_page()
+    cur.execute(*build_task_overview_query(filters, cursor, page_size))
+    rows = cur.fetchall()
+    if len(rows) <= page_size:
+        return rows, None
+    last = rows[page_size - 1]
+    return rows[:page_size], (last['priority_rank'], last['created_at'], last['id'])
+
+def task_overview_frame(rows):
+    data = []
+    for task in rows:
+        description = task['desc'] or 'No description'
+        if task['desc'] and len(task['desc']) > 50:
+            description = task['desc'][:50] + '...'
+        data.append({
+            "ID": task['id'],
+            "Title": task['title'],
+            "Description": description,
+            "Priority": task['priority'].upper(),
+            "Status": task['status'].upper(),
+            "Assigned To": task['assigned_to'] or "Unassigned",
+            "Created": task['created_at'].strftime('%Y-%m-%d %H:%M') if task['created_at'] else 'N/A',
+            "Due Date": task['due_date'].strftime('%Y-%m-%d') if task['due_date'] else 'Not set',
+            "Completed": task['completed_at'].strftime('%Y-%m-%d %H:%M') if task['completed_at'] else 'Not completed',
+            "Attachments": task['attachments']
+        })
+    return pd.DataFrame(data, columns=TASK_OVERVIEW_COLUMNS)
+
+def show_task_overview_grid(cur, filters, key, total=None):
+    # Renders one page of the overview with Previous/Next controls. The cursor
+    # stack lives in session_state under key and resets when the filters change.
+    if total is None:
+        total = count_task_overview(cur, filters)
+    if total == 0:
+        return total
+    
+    page_size = st.selectbox("Rows per page", TASK_PAGE_SIZES, index=2, key=f'{key}_page_size')
+    signature = (tuple(sorted(filters.items())), page_size)
+    if st.session_state.get(f'{key}_signature') != signature:
+        st.session_state[f'{key}_signature'] = signature
+        st.session_state[f'{key}_cursors'] = [None]
+    page_cursors = st.session_state[f'{key}_cursors']
+    
+    rows, next_cursor = fetch_task_overview_page(cur, filters, page_cursors[-1], page_size)
+    st.dataframe(task_overview_frame(rows), width='stretch', hide_index=True)
+    
+    page_count = (total + page_size - 1) // page_size
+    nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+    with nav_col1:
+        if st.button("◀ Previous", key=f'{key}_prev', disabled=len(page_cursors) == 1):
+            page_cursors.pop()
+            st.rerun()
+    with nav_col2:
+        st.markdown(f"Page {len(page_cursors)} of {page_count} ({total} tasks)")
+    with nav_col3:
+        if st.button("Next ▶", key=f'{key}_next', disabled=next_cursor is None):
+            page_cursors.append(next_cursor)
+            st.rerun()
+    return total
+
+def build_task_overview_csv_query(filters):
+    # The full filtered overview with the grid's display formatting done in
+    # SQL, for COPY ... TO STDOUT (see copy_csv()). Text columns go through
+    # NULLIF(..., '') because COPY quotes an empty string ("") and only leaves
+    # NULL as an empty field, which is what to_csv() wrote for both
+    query, params = build_task_overview_query(filters)
+    return f'''
+        SELECT t.id AS "ID", NULLIF(t.title, '') AS "Title",
+               COALESCE(NULLIF(t.desc, ''), 'No description') AS "Description",
+               NULLIF(upper(t.priority), '') AS "Priority", NULLIF(upper(t.status), '') AS "Status",
+               COALESCE(t.assigned_to, 'Unassigned') AS "Assigned To",
+               COALESCE(to_char(t.created_at, 'YYYY-MM-DD HH24:MI'), 'N/A') AS "Created",
+               COALESCE(to_char(t.due_date, 'YYYY-MM-DD'), 'Not set') AS "Due Date",
+               COALESCE(to_char(t.completed_at, 'YYYY-MM-DD HH24:MI'), 'Not completed') AS "Completed",
+               t.attachments AS "Attachments"
+        FROM ({query}) t
+        ORDER BY t.priority_rank, t.created_at DESC, t.id DESC
+    ''', params
+
+# Table exports
+# CSV, XLSX and Parquet, each written into a file object in bounded memory
+# (see Export jobs for where they run). CSV is COPY ... TO STDOUT of a query
+# that does the display formatting itself. XLSX and Parquet are written from a
+# row iterator over a server-side cursor, EXPORT_BATCH_SIZE rows at a time:
+# openpyxl's write_only workbook streams rows into the sheet, and Parquet is
+# written one record batch per chunk.
+# Columns are (header, kind) with kind one of int, text, category (priority,
+# status: dictionary-encoded in Parquet), date and timestamp; missing values
+# stay empty instead of the 'Not set' placeholders of the CSV/grid.
+
+EXPORT_BATCH_SIZE = 5000
+
+EXPORT_FORMATS = {
+    'CSV': ('csv', 'text/csv'),
+    'Excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'Parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+TASK_EXPORT_COLUMNS = [
+    ("ID", 'int'), ("Title", 'text'), ("Description", 'text'), ("Priority", 'category'),
+    ("Status", 'category'), ("Assigned To", 'text'), ("Created", 'timestamp'),
+    ("Due Date", 'date'), ("Completed", 'timestamp'), ("Attachments", 'int'),
+]
+
+DIRECTOR_EXPORT_COLUMNS = [
+    ("Username", 'text'), ("Password Hash", 'text'), ("Employee ID", 'text'), ("First Name", 'text'),
+    ("Last Name", 'text'), ("Department", 'text'), ("Designation", 'text'),
+]
+
+DIRECTORS_SQL = '''
+    SELECT username, password, employee_id, first_name, last_name, department, designation, is_director
+    FROM users 
+    WHERE is_director = TRUE
+    ORDER BY first_name, last_name
+'''
+
+# Empty strings are NULLed for COPY, as in build_task_overview_csv_query()
+DIRECTORS_CSV_SQL = '''
+    SELECT NULLIF(username, '') AS "Username",
+           NULLIF(CASE WHEN length(password) > 50 THEN left(password, 50) || '...' ELSE password END, '') AS "Password Hash",
+           NULLIF(employee_id, '') AS "Employee ID", NULLIF(first_name, '') AS "First Name",
+           NULLIF(last_name, '') AS "Last Name", NULLIF(department, '') AS "Department",
+           NULLIF(designation, '') AS "Designation"
+    FROM users
+    WHERE is_director = TRUE
+    ORDER BY first_name, last_name
+'''
+
+XLSX_NUMBER_FORMATS = {'date': 'yyyy-mm-dd', 'timestamp': 'yyyy-mm-dd hh:mm'}
+
+def copy_csv(conn, query, params, out):
+    # CSV with a header row straight from COPY ... TO STDOUT into the binary
+    # file out: the server formats and streams it, nothing is held in Python
+    cur = conn.cursor()
+    try:
+        cur.copy_expert(f"COPY ({cur.mogrify(query, params).decode()}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+    finally:
+        cur.close()
+
+def iter_query_rows(conn, query, params=None):
+    # Server-side (named) cursor, fetched EXPORT_BATCH_SIZE rows per round trip
+    cur = conn.cursor(name=f'export_{uuid.uuid4().hex}', cursor_factory=DictCursor)
+    cur.itersize = EXPORT_BATCH_SIZE
+    try:
+        cur.execute(query, params)
+        yield from cur
+    finally:
+        cur.close()
+
+def iter_task_overview_rows(conn, filters):
+    for task in iter_query_rows(conn, *build_task_overview_query(filters)):
+        yield (task['id'], task['title'], task['desc'], task['priority'].upper(), task['status'].upper(),
+               task['assigned_to'], task['created_at'], task['due_date'], task['completed_at'],
+               task['attachments'])
+
+def _director_export_row(dir_user):
+    return (dir_user['username'],
+            dir_user['password'][:50] + "..." if len(dir_user['password']) > 50 else dir_user['password'],
+            dir_user['employee_id'], dir_user['first_name'], dir_user['last_name'],
+            dir_user['department'], dir_user['designation'])
+
+def iter_director_rows(conn):
+    for dir_user in iter_query_rows(conn, DIRECTORS_SQL):
+        yield _director_export_row(dir_user)
+
+def write_xlsx(columns, rows, out, sheet_title='Export'):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_title)
+    sheet.append([header for header, _ in columns])
+    formats = [XLSX_NUMBER_FORMATS.get(kind) for _, kind in columns]
+    for row in rows:
+        cells = []
+        for value, number_format in zip(row, formats):
+            if number_format and value is not None:
+                value = WriteOnlyCell(sheet, value)
+                value.number_format = number_format
+            cells.append(value)
+        sheet.append(cells)
+    workbook.save(out)
+
+def _arrow_type(kind):
+    return {
+        'int': pa.int64(),
+        'text': pa.string(),
+        'category': pa.dictionary(pa.int32(), pa.string()),
+        'date': pa.date32(),
+        'timestamp': pa.timestamp('us'),
+    }[kind]
+
+def write_parquet(columns, rows, out):
+    schema = pa.schema([(header, _arrow_type(kind)) for header, kind in columns])
+    writer = pq.ParquetWriter(out, schema, compression='zstd')
+    try:
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, EXPORT_BATCH_SIZE))
+            if not batch:
+                break
+            arrays = [pa.array([row[i] for row in batch], type=field.type) for i, field in enumerate(schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+    finally:
+        writer.close()
+
+# Export jobs
+# Pages only queue exports: a row in export_jobs (migration 10) that a worker
+# claims with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers (the
+# thread in each app process and/or `task_manager.py export-worker` processes)
+# can share the queue without taking the same job twice. The file is written
+# to a temporary file, uploaded to blob storage under exports/ and offered
+# through the file server with a signed link in the Exports panel (or, without
+# a file server, a download button that reads it when clicked). A running
+# job bumps heartbeat_at from a timer thread for as long as it runs (COPY and
+# the upload included); one whose worker died is claimed again once the
+# heartbeat is EXPORT_JOB_STALE_SECONDS old. Finished jobs and their
+# files are purged after EXPORT_RETENTION_SECONDS.
+
+EXPORT_JOB_STALE_SECONDS = 300
+
+EXPORT_JOB_MAX_ATTEMPTS = 3
+
+EXPORT_RETENTION_SECONDS = 7 * 24 * 3600
+
+EXPORT_PANEL_REFRESH_SECONDS = 3
+
+# kind -> columns, sheet title, typed row iterator and CSV query (formatted in
+# SQL, see copy_csv()); params are the JSON stored with the job
+EXPORT_KINDS = {
+    'tasks': {
+        'columns': TASK_EXPORT_COLUMNS,
+        'sheet_title': "Tasks",
+        'rows': lambda conn, params: iter_task_overview_rows(conn, params['filters']),
+        'csv': lambda params: build_task_overview_csv_query(params['filters']),
+    },
+    'directors': {
+        'columns': DIRECTOR_EXPORT_COLUMNS,
+        'sheet_title': "Directors",
+        'rows': lambda conn, params: iter_director_rows(conn),
+        'csv': lambda params: (DIRECTORS_CSV_SQL, ()),
+    },
+}
+
+CLAIM_EXPORT_JOB_SQL = '''
+    UPDATE export_jobs
+    SET status = 'running', attempts = attempts + 1, worker = %s,
+        started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+    WHERE id = (
+        SELECT id FROM export_jobs
+        WHERE status = 'queued'
+           OR (status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *
+'''
+
+def export_key(job_id, file_name):
+    # Flat, so purging a job leaves no empty directory behind on local storage
+    return f"exports/{job_id}-{file_name}"
+
+def queue_export(conn, username, kind, params, export_format, file_stem):
+    extension = EXPORT_FORMATS[export_format][0]
+    file_name = f"{file_stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    cur = conn.cursor()
+    try:
+        cur.execute('''
+            INSERT INTO export_jobs (created_by, kind, params, export_format, file_name)
+            VALUES (%s, %s, %s, %s, %s) RETURNING id
+        ''', (username, kind, json.dumps(params, default=str), export_format, file_name))
+        job_id = cur.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+    return job_id
+
+def export_url(job):
+    # Signed file server link to a finished export (same scheme as
+    # attachments), or None without a file server
+    if _get_file_server_config()['public_url'] is None:
+        return None
+    get_file_server()
+    expires = (int(time.time()) // FILE_LINK_TTL + 2) * FILE_LINK_TTL
+    query = urllib.parse.urlencode({'e': expires, 's': _sign_file_link(f"export/{job['id']}", job['file_name'], expires)})
+    return (f"{_get_file_server_config()['public_url']}/exports/{job['id']}/"
+            f"{urllib.parse.quote(job['file_name'], safe='')}?{query}")
+
+class ExportWorker:
+    # Runs export jobs until stopped. connect() returns a connection whose
+    # close() releases it (a pool checkout or a plain psycopg2 connection).
+    # Each job uses two: one holding the export's read transaction, one for
+    # committing status and heartbeats.
+    def __init__(self, connect, storage, poll_interval=2.0, stale_after=EXPORT_JOB_STALE_SECONDS,
+                 max_attempts=EXPORT_JOB_MAX_ATTEMPTS, retention=EXPORT_RETENTION_SECONDS):
+        self._connect = connect
+        self._storage = storage
+        self._poll_interval = poll_interval
+        self._stale_after = stale_after
+        self._max_attempts = max_attempts
+        self._retention = retention
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+    
+    def start(self):
+        thread = threading.Thread(target=self.run_forever, name="export-worker", daemon=True)
+        thread.start()
+        return thread
+    
+    def stop(self):
+        self._stop.set()
+    
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                if self.run_once():
+                    continue
+                self.purge_expired()
+            except Exception:
+                logger.exception("Export worker %s: polling failed", self.name)
+            self._stop.wait(self._poll_interval)
+    
+    def run_once(self):
+        # Claims and runs one job; False if the queue was empty
+        conn = self._connect()
+        try:
+            cur = conn.cursor(cursor_factory=DictCursor)
+            cur.execute(CLAIM_EXPORT_JOB_SQL, (self.name, self._stale_after))
+            job = cur.fetchone()
+            conn.commit()
+            if job is None:
+                return False
+            if job['attempts'] > self._max_attempts:
+                self._finish(cur, job['id'], 'failed', error=f"Gave up after {self._max_attempts} attempts")
+            else:
+                self._run_job(cur, job)
+            return True
+        finally:
+            conn.close()
+    
+    def _finish(self, cur, job_id, status, size=None, error=None):
+        cur.execute('''
+            UPDATE export_jobs SET status = %s, size = %s, error = %s, finished_at = CURRENT_TIMESTAMP
+            WHERE id = %s AND worker = %s
+        ''', (status, size, error, job_id, self.name))
+        cur.connection.commit()
+    
+    def _start_heartbeat(self, conn, job_id):
+        # Bumps heartbeat_at every stale_after / 3 seconds from a thread until
+        # the returned function is called. conn is the status connection,
+        # which the job leaves alone while it runs.
+        stopped = threading.Event()
+        
+        def beat():
+            cur = conn.cursor()
+            while not stopped.wait(self._stale_after / 3):
+                try:
+                    cur.execute('''
+                        UPDATE export_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND worker = %s
+                    ''', (job_id, self.name))
+                    conn.commit()
+                except psycopg2.Error:
+                    logger.exception("Export job %s: heartbeat failed", job_id)
+                    conn.rollback()
+            cur.close()
+        
+        thread = threading.Thread(target=beat, name=f"export-heartbeat-{job_id}", daemon=True)
+        thread.start()
+        
+        def stop():
+            stopped.set()
+            thread.join()
+        return stop
+    
+    def _run_job(self, cur, job):
+        kind = EXPORT_KINDS.get(job['kind'])
+        if kind is None:
+            return self._finish(cur, job['id'], 'failed', error=f"Unknown export kind: {job['kind']}")
+        stop_heartbeat = self._start_heartbeat(cur.connection, job['id'])
+        read_conn = self._connect()
+        error = None
+        try:
+            with tempfile.TemporaryFile() as out:
+                if job['export_format'] == 'CSV':
+                    copy_csv(read_conn, *kind['csv'](job['params']), out)
+                else:
+                    rows = kind['rows'](read_conn, job['params'])
+                    if job['export_format'] == 'Excel':
+                        write_xlsx(kind['columns'], rows, out, kind['sheet_title'])
+                    else:
+                        write_parquet(kind['columns'], rows, out)
+                read_conn.rollback()
+                size = out.tell()
+                out.seek(0)
+                self._storage.put(export_key(job['id'], job['file_name']), out)
+        except Exception as e:
+            logger.exception("Export job %s failed", job['id'])
+            read_conn.rollback()
+            error = str(e)
+        finally:
+            stop_heartbeat()
+            read_conn.close()
+        if error is None:
+            self._finish(cur, job['id'], 'completed', size=size)
+        else:
+            self._finish(cur, job['id'], 'failed', error=error)
+    
+    def purge_expired(self, limit=100):
+        # Removes finished jobs past the retention period with their files
+        conn = self._connect()
+        try:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT id, file_name FROM export_jobs
+                WHERE status IN ('completed', 'failed')
+                  AND finished_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 second'
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ''', (self._retention, limit))
+            removed = []
+            for job_id, file_name in cur.fetchall():
+                try:
+                    self._storage.delete(export_key(job_id, file_name))
+                    removed.append(job_id)
+                except OSError as e:
+                    logger.warning("Could not delete export %s: %s", job_id, e)
+            if removed:
+                cur.execute('DELETE FROM export_jobs WHERE id = ANY(%s)', (removed,))
+            conn.commit()
+            return len(removed)
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+def _get_export_config():
+    try:
+        return dict(st.secrets["exports"])
+    except (KeyError, AttributeError, FileNotFoundError):
+        return {}
+
+@st.cache_resource
+def get_export_workers():
+    # Worker threads in this process; [exports] workers = 0 leaves the queue to
+    # export-worker processes
+    storage = get_blob_storage()
+    workers = [ExportWorker(get_db_pool().getconn, storage)
+               for _ in range(int(_get_export_config().get("workers", 1)))]
+    for worker in workers:
+        worker.start()
+    return workers
+
+def show_export_download(label, key, file_stem, user, kind, params=None):
+    # Format picker plus a button that queues the export; the file shows up in
+    # the Exports panel when the worker is done
+    get_export_workers()
+    format_col, button_col = st.columns([1, 3])
+    with format_col:
+        export_format = st.selectbox("Format", list(EXPORT_FORMATS), key=f'{key}_format',
+                                     label_visibility="collapsed")
+    with button_col:
+        extension = EXPORT_FORMATS[export_format][0]
+        if st.button(f"{label} ({extension.upper()})", key=f'{key}_queue'):
+            conn = get_db_connection()
+            try:
+                queue_export(conn, user['username'], kind, params or {}, export_format, file_stem)
+            finally:
+                conn.close()
+            st.toast("Export queued, it will appear under 📦 My Exports")
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+
+EXPORT_STATUS_LABELS = {
+    'queued': "⏳ Queued",
+    'running': "⚙️ Running",
+    'completed': "✅ Ready",
+    'failed': "❌ Failed",
+}
+
+@st.fragment(run_every=EXPORT_PANEL_REFRESH_SECONDS)
+def show_exports_panel(user):
+    # This user's recent exports; reruns on its own so queued jobs turn into
+    # download links without reloading the page
+    conn = get_db_connection()
+    try:
+        cur = conn.cursor(cursor_factory=DictCursor)
+        cur.execute('''
+            SELECT id, file_name, export_format, status, size, error, created_at, finished_at
+            FROM export_jobs WHERE created_by = %s
+            ORDER BY id DESC LIMIT 20
+        ''', (user['username'],))
+        jobs = cur.fetchall()
+        conn.rollback()
+    finally:
+        conn.close()
+    if not jobs:
+        return
+    with st.expander("📦 My Exports", expanded=any(job['status'] in ('queued', 'running') for job in jobs)):
+        for job in jobs:
+            name_col, status_col, size_col, link_col = st.columns([4, 2, 1, 2])
+            name_col.markdown(f"**{job['file_name']}**  \n{job['created_at']:%Y-%m-%d %H:%M}")
+            status_col.markdown(EXPORT_STATUS_LABELS[job['status']])
+            if job['status'] == 'completed':
+                size_col.markdown(_format_size(job['size']))
+                url = export_url(job)
+                if url:
+                    link_col.link_button("📥 Download", url)
+                else:
+                    # No file server: the app sends the file, read only when clicked
+                    storage = get_blob_storage()
+                    key = export_key(job['id'], job['file_name'])
+                    link_col.download_button("📥 Download", data=lambda key=key: storage.get(key),
+                                             file_name=job['file_name'], mime=EXPORT_FORMATS[job['export_format']][1],
+                                             key=f"export_download_{job['id']}", on_click="ignore")
+            elif job['status'] == 'failed':
+                link_col.caption(job['error'] or "Unknown error")
+
+# Bulk task import
+# Parsed rows are COPYed into a temporary staging table, validated there and
+# turned into tasks and assignments with one INSERT ... SELECT each, so an
+# import costs a handful of statements however many rows it has. Every check
+# is a query over the whole staging table: a bad row ends up in the error
+# report instead of aborting the transaction for the rows after it. Row numbers
+# are spreadsheet rows (the header is row 1).
+# Files are read and imported in chunks of TASK_IMPORT_CHUNK_SIZE rows, each
+# committed together with its import_jobs progress, so memory stays flat and
+# an interrupted import resumes after its last committed chunk. Re-importing
+# the same rows is idempotent through tasks.import_fingerprint.
+
+TASK_IMPORT_COLUMNS = ['title', 'desc', 'priority', 'status', 'due_date', 'assigned_to']
+
+TASK_IMPORT_CHUNK_SIZE = 5000
+
+# pg_try_advisory_lock(class, job id): one runner per import job
+IMPORT_JOB_LOCK_CLASS = 7261002
+
+TASK_IMPORT_STAGING_SQL = '''
+    CREATE TEMP TABLE task_import_staging (
+        row_number INTEGER NOT NULL,
+        title TEXT,
+        description TEXT,
+        priority TEXT,
+        status TEXT,
+        due_date DATE,
+        assigned_to TEXT,
+        fingerprint TEXT,
+        action TEXT,
+        task_id INTEGER
+    ) ON COMMIT DROP;
+    CREATE TEMP TABLE task_import_errors (
+        row_number INTEGER NOT NULL,
+        column_name TEXT NOT NULL,
+        reason TEXT NOT NULL
+    ) ON COMMIT DROP
+'''
+
+TASK_IMPORT_VALIDATE_SQL = '''
+    INSERT INTO task_import_errors (row_number, column_name, reason)
+    SELECT row_number, 'title', 'Missing title' FROM task_import_staging
+    WHERE COALESCE(lower(btrim(title)), '') IN ('', 'nan', 'none');
+    
+    INSERT INTO task_import_errors (row_number, column_name, reason)
+    SELECT row_number, 'assigned_to', 'Missing assigned users' FROM task_import_staging s
+    WHERE COALESCE(lower(btrim(assigned_to)), '') IN ('', 'nan', 'none')
+      AND NOT EXISTS (SELECT 1 FROM task_import_errors e WHERE e.row_number = s.row_number);
+    
+    -- Unknown usernames are dropped; a row needs at least one real assignee
+    CREATE TEMP TABLE task_import_assignees ON COMMIT DROP AS
+    SELECT DISTINCT s.row_number, u.username
+    FROM task_import_staging s
+    CROSS JOIN LATERAL unnest(string_to_array(s.assigned_to, ',')) AS a (name)
+    JOIN users u ON u.username = btrim(a.name);
+    
+    INSERT INTO task_import_errors (row_number, column_name, reason)
+    SELECT row_number, 'assigned_to', 'No valid users found' FROM task_import_staging s
+    WHERE NOT EXISTS (SELECT 1 FROM task_import_assignees a WHERE a.row_number = s.row_number)
+      AND NOT EXISTS (SELECT 1 FROM task_import_errors e WHERE e.row_number = s.row_number)
+'''
+
+# A row whose fingerprint matches an existing task (or a later row of the same
+# chunk) does not create a task: if its priority or status differ the task is
+# updated, otherwise the row is left as it is. action ends up 'created',
+# 'updated', 'duplicate' (superseded by a later row) or NULL (unchanged).
+TASK_IMPORT_INSERT_SQL = '''
+    UPDATE task_import_staging s
+    SET fingerprint = encode(sha256(convert_to(concat_ws(E'\\x1f',
+            btrim(s.title), COALESCE(s.description, ''), COALESCE(s.due_date::text, ''), a.usernames
+        ), 'UTF8')), 'hex')
+    FROM (
+        SELECT row_number, string_agg(username, ',' ORDER BY username) AS usernames
+        FROM task_import_assignees GROUP BY row_number
+    ) a
+    WHERE a.row_number = s.row_number
+      AND NOT EXISTS (SELECT 1 FROM task_import_errors e WHERE e.row_number = s.row_number);
+    
+    UPDATE task_import_staging s SET action = 'duplicate'
+    WHERE EXISTS (SELECT 1 FROM task_import_staging later
+                  WHERE later.fingerprint = s.fingerprint AND later.row_number > s.row_number);
+    
+    WITH upserted AS (
+        INSERT INTO tasks (title, "desc", priority, status, due_date, completed_at, import_fingerprint)
+        SELECT title, description, priority, status, due_date,
+               CASE WHEN status = 'completed' THEN CURRENT_TIMESTAMP END, fingerprint
+        FROM (
+            SELECT row_number, btrim(title) AS title, description, due_date, fingerprint,
+                   CASE WHEN lower(btrim(priority)) IN ('low', 'medium', 'high', 'urgent')
+                        THEN lower(btrim(priority)) ELSE 'medium' END AS priority,
+                   CASE WHEN lower(btrim(status)) IN ('pending', 'due', 'completed')
+                        THEN lower(btrim(status)) ELSE 'pending' END AS status
+            FROM task_import_staging
+            WHERE fingerprint IS NOT NULL AND action IS NULL
+        ) s
+        ORDER BY row_number
+        ON CONFLICT (import_fingerprint) WHERE import_fingerprint IS NOT NULL DO UPDATE
+        SET priority = EXCLUDED.priority,
+            status = EXCLUDED.status,
+            completed_at = CASE WHEN EXCLUDED.status <> 'completed' THEN NULL
+                                ELSE COALESCE(tasks.completed_at, CURRENT_TIMESTAMP) END
+        WHERE (tasks.priority, tasks.status) IS DISTINCT FROM (EXCLUDED.priority, EXCLUDED.status)
+        RETURNING id, import_fingerprint, xmax = 0 AS inserted
+    )
+    UPDATE task_import_staging s
+    SET task_id = u.id, action = CASE WHEN u.inserted THEN 'created' ELSE 'updated' END
+    FROM upserted u
+    WHERE s.fingerprint = u.import_fingerprint AND s.action IS NULL;
+    
+    INSERT INTO task_assignments (task_id, username)
+    SELECT s.task_id, a.username
+    FROM task_import_staging s
+    JOIN task_import_assignees a ON a.row_number = s.row_number
+    WHERE s.action = 'created'
+'''
+
+TASK_IMPORT_DEFAULTS = {'priority': 'medium', 'status': 'pending'}
+
+TASK_IMPORT_ALLOWED = {
+    'priority': ['low', 'medium', 'high', 'urgent'],
+    'status': ['pending', 'due', 'completed'],
+}
+
+TASK_IMPORT_ERROR_COLUMNS = ['row', 'column', 'reason']
+
+def _blank(values):
+    # Empty cells, whitespace and the 'nan'/'none' text pandas leaves behind
+    text = values.astype('string').str.strip()
+    return text.isna() | text.str.lower().isin(['', 'nan', 'none'])
+
+def _parse_date(value):
+    # One cell as the calendar date it names (its own wall clock if it carries
+    # an offset), or None
+    try:
+        parsed = pd.to_datetime(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+    return None if pd.isna(parsed) else parsed.date()
+
+def validate_task_import(df, usernames):
+    # Column-wise validation of an uploaded sheet or chunk of one (columns by
+    # position, see TASK_IMPORT_COLUMNS; the index is the 0-based data row).
+    # Returns (frame of valid rows ready for import_tasks(), error frame with
+    # one (row, column, reason) per problem).
+    frame = df.iloc[:, :len(TASK_IMPORT_COLUMNS)].copy()
+    frame.columns = TASK_IMPORT_COLUMNS[:frame.shape[1]]
+    frame = frame.reindex(columns=TASK_IMPORT_COLUMNS)
+    frame['row'] = frame.index + 2
+    frame.index = frame['row']
+    problems = []
+    
+    def flag(mask, column, reasons):
+        if mask.any():
+            reason = reasons[mask] if isinstance(reasons, pd.Series) else reasons
+            problems.append(pd.DataFrame({'row': frame.index[mask], 'column': column, 'reason': reason}))
+    
+    missing_title = _blank(frame['title'])
+    flag(missing_title, 'title', "Missing title")
+    frame['title'] = frame['title'].astype('string').str.strip()
+    frame['desc'] = frame['desc'].astype('string').where(~_blank(frame['desc']))
+    
+    # Priority and status: case-insensitive, blank means the default, anything
+    # else is an error rather than a silent default
+    for column, allowed in TASK_IMPORT_ALLOWED.items():
+        values = frame[column].astype('string').str.strip().str.lower()
+        values = values.where(~_blank(frame[column]), TASK_IMPORT_DEFAULTS[column])
+        invalid = ~values.isin(allowed)
+        flag(invalid, column, "Must be one of " + ", ".join(allowed) + ": '" + frame[column].astype('string') + "'")
+        frame[column] = values
+    
+    no_date = _blank(frame['due_date'])
+    try:
+        due_dates = pd.to_datetime(frame['due_date'].where(~no_date), errors='coerce').dt.date
+    except (ValueError, TypeError, OverflowError):
+        # Offsets that differ between cells (an export spanning a DST change)
+        due_dates = pd.Series(None, index=frame.index, dtype=object)
+    # pandas >= 2 infers one format (and offset) for the whole column from its
+    # first value, so cells written another way (01/06/2024 after 2024-01-05)
+    # fail above; parse those one distinct value at a time, as a per-cell
+    # parse would
+    retry = ~no_date & due_dates.isna()
+    if retry.any():
+        parsed = {value: _parse_date(value) for value in frame.loc[retry, 'due_date'].unique()}
+        due_dates[retry] = frame.loc[retry, 'due_date'].map(parsed)
+    flag(~no_date & due_dates.isna(), 'due_date', "Not a date: '" + frame['due_date'].astype('string') + "'")
+    frame['due_date'] = due_dates
+    
+    # Assignees: one username per exploded cell, all checked against one set
+    names = frame['assigned_to'].astype('string').str.split(',').explode().str.strip()
+    names = names[names.notna() & (names != '')]
+    unknown = names[~names.isin(usernames)]
+    if len(unknown):
+        problems.append(pd.DataFrame({'row': unknown.index, 'column': 'assigned_to',
+                                      'reason': "Unknown user '" + unknown + "'"}))
+    flag(~frame.index.isin(names.index), 'assigned_to', "Missing assigned users")
+    frame['assigned_to'] = frame['assigned_to'].astype('string')
+    
+    errors = (pd.concat(problems, ignore_index=True) if problems
+              else pd.DataFrame(columns=TASK_IMPORT_ERROR_COLUMNS))
+    errors = errors.astype({'row': int, 'reason': str}).sort_values('row', kind='stable', ignore_index=True)
+    return frame[~frame.index.isin(errors['row'])].reset_index(drop=True), errors
+
+def import_tasks(cur, frame):
+    # frame has a 'row' column plus TASK_IMPORT_COLUMNS (due_date already a
+    # date or empty), normally from validate_task_import(). Imports all valid
+    # rows in the caller's transaction and returns (created, updated,
+    # unchanged, [(row, column, reason), ...]); the checks here only catch
+    # what changed since validation (e.g. a user deleted in between).
+    cur.execute(TASK_IMPORT_STAGING_SQL)
+    buffer = io.StringIO()
+    frame[['row'] + TASK_IMPORT_COLUMNS].to_csv(buffer, index=False, header=False, date_format='%Y-%m-%d')
+    buffer.seek(0)
+    cur.copy_expert('''
+        COPY task_import_staging (row_number, title, description, priority, status, due_date, assigned_to)
+        FROM STDIN WITH (FORMAT csv)
+    ''', buffer)
+    cur.execute(TASK_IMPORT_VALIDATE_SQL)
+    cur.execute(TASK_IMPORT_INSERT_SQL)
+    cur.execute('''
+        SELECT count(*) FILTER (WHERE action = 'created'),
+               count(*) FILTER (WHERE action = 'updated'),
+               count(*) FILTER (WHERE fingerprint IS NOT NULL AND (action IS NULL OR action = 'duplicate'))
+        FROM task_import_staging
+    ''')
+    created, updated, unchanged = cur.fetchone()
+    cur.execute('SELECT row_number, column_name, reason FROM task_import_errors ORDER BY row_number')
+    return created, updated, unchanged, [tuple(row) for row in cur.fetchall()]
+
+def _is_csv(uploaded_file):
+    return uploaded_file.name.lower().endswith('.csv')
+
+def count_import_rows(uploaded_file):
+    # Data rows for the progress bar, without parsing the file: newlines for
+    # CSV (quoted line breaks make it an estimate), the sheet dimension for
+    # Excel. None if unknown.
+    uploaded_file.seek(0)
+    if _is_csv(uploaded_file):
+        lines = sum(block.count(b'\n') for block in iter(lambda: uploaded_file.read(1024 * 1024), b''))
+        return max(lines - 1, 0)
+    if uploaded_file.name.lower().endswith('.xlsx'):
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            max_row = workbook.active.max_row
+            return max(max_row - 1, 0) if max_row else None
+        finally:
+            workbook.close()
+    return None
+
+def iter_import_chunks(uploaded_file, start_row=0, chunk_size=TASK_IMPORT_CHUNK_SIZE):
+    # DataFrames of at most chunk_size rows, starting at data row start_row;
+    # the index is the 0-based data row, so row numbers survive a resume
+    uploaded_file.seek(0)
+    if _is_csv(uploaded_file):
+        # Our own text wrapper, detached afterwards: closing one pandas opens
+        # would close the upload too, and a resume reads it again
+        text = io.TextIOWrapper(uploaded_file, encoding='utf-8', newline='')
+        try:
+            # A resume parses and drops the records before start_row rather
+            # than skipping file lines: blank lines and quoted line breaks
+            # make the two differ
+            offset = 0
+            for chunk in pd.read_csv(text, chunksize=chunk_size):
+                if chunk.empty:
+                    break
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                chunk = chunk.loc[start_row:]
+                if len(chunk):
+                    yield chunk
+        finally:
+            text.detach()
+    elif uploaded_file.name.lower().endswith('.xlsx'):
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(min_row=start_row + 2, values_only=True)
+            offset = start_row
+            while True:
+                batch = list(itertools.islice(rows, chunk_size))
+                if not batch:
+                    break
+                chunk = pd.DataFrame(batch, index=pd.RangeIndex(offset, offset + len(batch)))
+                offset += len(batch)
+                # Formatted but empty rows (pandas' reader drops them too)
+                chunk = chunk.dropna(how='all')
+                if len(chunk):
+                    yield chunk
+        finally:
+            workbook.close()
+    else:
+        # Legacy .xls: no streaming reader, read whole (needs xlrd)
+        df = pd.read_excel(uploaded_file).iloc[start_row:]
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+
+def start_import_job(conn, uploaded_file, file_sha256, username):
+    cur = conn.cursor()
+    cur.execute('''
+        INSERT INTO import_jobs (created_by, filename, file_sha256, total_rows)
+        VALUES (%s, %s, %s, %s) RETURNING id
+    ''', (username, uploaded_file.name, file_sha256, count_import_rows(uploaded_file)))
+    job_id = cur.fetchone()[0]
+    conn.commit()
+    cur.close()
+    return job_id
+
+def run_import_job(conn, job_id, uploaded_file, progress=None):
+    # Imports the file from the job's last committed row on. Each chunk is
+    # validated, imported and recorded (progress and error rows) in one
+    # transaction. progress(rows_done, total_rows) is called after each chunk.
+    # Returns False if another session is running this job right now.
+    cur = conn.cursor()
+    cur.execute('SELECT pg_try_advisory_lock(%s, %s)', (IMPORT_JOB_LOCK_CLASS, job_id))
+    if not cur.fetchone()[0]:
+        conn.rollback()
+        return False
+    try:
+        cur.execute('SELECT rows_done, total_rows FROM import_jobs WHERE id = %s', (job_id,))
+        rows_done, total_rows = cur.fetchone()
+        cur.execute("UPDATE import_jobs SET status = 'running', last_error = NULL WHERE id = %s", (job_id,))
+        cur.execute('SELECT username FROM users')
+        usernames = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        
+        for chunk in iter_import_chunks(uploaded_file, start_row=rows_done):
+            frame, errors = validate_task_import(chunk, usernames)
+            created, updated, unchanged, import_errors = import_tasks(cur, frame)
+            error_rows = [tuple(row) for row in errors.itertuples(index=False)] + import_errors
+            if error_rows:
+                execute_values(cur, '''
+                    INSERT INTO import_job_errors (job_id, row_number, column_name, reason) VALUES %s
+                ''', [(job_id, int(row), column, reason) for row, column, reason in error_rows])
+            rows_done = int(chunk.index[-1]) + 1
+            cur.execute('''
+                UPDATE import_jobs
+                SET rows_done = %s, created_count = created_count + %s,
+                    updated_count = updated_count + %s, unchanged_count = unchanged_count + %s,
+                    error_count = error_count + %s, updated_at = CURRENT_TIMESTAMP
+                WHERE id = %s
+            ''', (rows_done, created, updated, unchanged, len({row for row, _, _ in error_rows}), job_id))
+            conn.commit()
+            if progress:
+                progress(rows_done, total_rows)
+        
+        cur.execute('''
+            UPDATE import_jobs SET status = 'completed', total_rows = rows_done, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (job_id,))
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        cur.execute('''
+            UPDATE import_jobs SET status = 'failed', last_error = %s, updated_at = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (str(e), job_id))
+        conn.commit()
+        raise
+    finally:
+        cur.execute('SELECT pg_advisory_unlock(%s, %s)', (IMPORT_JOB_LOCK_CLASS, job_id))
+        conn.commit()
+        cur.close()
+
+def import_job_errors_frame(cur, job_id):
+    cur.execute('''
+        SELECT row_number, column_name, reason FROM import_job_errors
+        WHERE job_id = %s ORDER BY row_number
+    ''', (job_id,))
+    return pd.DataFrame([tuple(row) for row in cur.fetchall()], columns=TASK_IMPORT_ERROR_COLUMNS)
+
+# Query plan regression check
+# Seeds realistic row counts inside a transaction that is always rolled back,
+# then EXPLAINs every hot query and fails if any of them falls back to a
+# filtered sequential scan of one of the big tables (reading the whole table
+# to pick out a few rows is what a missing index looks like). Unfiltered scans
+# the planner picks to build a hash join are fine. Run it against a staging or
+# CI database:
+#     python task_manager.py check-query-plans [--dsn postgresql://...]
+
+PLAN_CHECK_TABLES = {
+    'users', 'tasks', 'task_assignments', 'task_attachments', 'chat_conversations',
+    'chat_participants', 'chats', 'chat_attachments', 'notices', 'notice_attachments',
+}
+
+PLAN_CHECK_ROWS = {
+    'users': 3000,
+    'tasks': 20000,
+    'chats': 100000,
+    'notices': 3000,
+}
+
+HOT_QUERIES = {
+    'user department': lambda s: (USER_DEPARTMENT_SQL, (s['username'],)),
+    'task list page': lambda s: build_task_list_query({}, None, 25),
+    'task list next page': lambda s: build_task_list_query({}, s['task_cursor'], 25),
+    'task list page (own tasks)': lambda s: build_task_list_query({}, None, 25, visible_to=s['username']),
+    'task list page (priority)': lambda s: build_task_list_query({'priority': 'high'}, None, 25),
+    'task list page (status)': lambda s: build_task_list_query({'status': 'due'}, None, 25),
+    'task list page (due dates)': lambda s: build_task_list_query({'due_from': s['due_from'], 'due_to': s['due_to']}, None, 25),
+    'task list page (assignee)': lambda s: build_task_list_query({'assignee': s['username']}, None, 25),
+    'task list page (department)': lambda s: build_task_list_query({'department': s['department']}, None, 25),
+    'task overview page': lambda s: build_task_overview_query({}, None, 50),
+    'task overview next page': lambda s: build_task_overview_query({}, s['task_cursor'], 50),
+    'task overview (month)': lambda s: build_task_overview_query({'created_month': s['due_from']}, None, 50),
+    'task overview (user)': lambda s: build_task_overview_query({'assignee': s['username']}, None, 50),
+    'task overview (department)': lambda s: build_task_overview_query({'department': s['department']}, None, 50),
+    'task assignees (batch)': lambda s: (TASK_ASSIGNEES_BATCH_SQL, (s['task_ids'],)),
+    'task attachments (batch)': lambda s: (TASK_ATTACHMENTS_BATCH_SQL, (s['task_ids'],)),
+    'users with task counts': lambda s: (USERS_WITH_TASK_COUNTS_SQL, ()),
+    'cache version': lambda s: (CACHE_VERSION_SQL, ('user_task_counts',)),
+    'user assigned tasks': lambda s: (USER_ASSIGNED_TASKS_SQL, (s['username'],)),
+    'user chats': lambda s: (USER_CHATS_SQL, (s['username'],)),
+    'chat participants': lambda s: (CHAT_PARTICIPANTS_SQL, (s['chat_id'], s['username'])),
+    'chat messages': lambda s: (CHAT_MESSAGES_SQL, (s['chat_id'], CHAT_BUFFER_SIZE)),
+    'chat new messages': lambda s: (CHAT_NEW_MESSAGES_SQL, (s['chat_id'], s['message_created_at'] - CHAT_CURSOR_OVERLAP, CHAT_BUFFER_SIZE)),
+    'chat older messages': lambda s: (CHAT_OLDER_MESSAGES_SQL, (s['chat_id'], s['message_created_at'], s['message_id'], CHAT_BUFFER_SIZE)),
+    'chat message attachments': lambda s: (CHAT_MESSAGE_ATTACHMENTS_SQL, (s['message_ids'],)),
+    'active notices': lambda s: (ACTIVE_NOTICES_SQL, ()),
+    'notice attachments': lambda s: (NOTICE_ATTACHMENTS_SQL, (s['notice_id'],)),
+}
+
+def _seed_plan_check_data(cur, rows=PLAN_CHECK_ROWS):
+    n_users = rows['users']
+    cur.execute('''
+        INSERT INTO users (username, password, employee_id, first_name, last_name, department, designation)
+        SELECT 'plan_user_' || g, 'x', 'PLAN' || lpad(g::text, 8, '0'), 'First' || g, 'Last' || g,
+               'Plan Dept ' || (g %% 25), (ARRAY['HOD', 'SUB-HOD', 'EMPLOYEE'])[1 + g %% 3]
+        FROM generate_series(1, %s) g
+    ''', (n_users,))
     cur.execute('''
-        SELECT column_name FROM information_schema.columns 
-        WHERE table_name='chats' AND column_name='chat_id'
-    ''')
-    has_chat_id = cur.fetchone()
-    
-    # Migrate to new schema if needed
-    if not has_chat_id:
-        cur.execute('DROP TABLE IF EXISTS chats CASCADE')
-        cur.execute('DROP TABLE IF EXISTS chat_participants CASCADE')
-        cur.execute('DROP TABLE IF EXISTS chat_conversations CASCADE')
-    
-    # Chat conversations table
+        INSERT INTO tasks (title, "desc", priority, status, due_date, created_at)
+        SELECT 'Plan task ' || g, 'Seeded by check-query-plans',
+               (ARRAY['low', 'medium', 'high', 'urgent'])[1 + g %% 4],
+               (ARRAY['pending', 'due', 'completed'])[1 + g %% 3],
+               CURRENT_DATE + (g %% 90), NOW() - g * INTERVAL '1 minute'
+        FROM generate_series(1, %s) g
+    ''', (rows['tasks'],))
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS chat_conversations (
-            id SERIAL PRIMARY KEY,
-            chat_name TEXT,
-            chat_type TEXT NOT NULL CHECK (chat_type IN ('individual', 'group', 'all')),
-            created_by TEXT REFERENCES users(username) ON DELETE SET NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            join_link TEXT UNIQUE
-        )
-    ''')
-    
-    # Chat participants table
+        INSERT INTO task_assignments (task_id, username)
+        SELECT t.id, 'plan_user_' || (1 + (t.id * 7 + k * 13) %% %s)
+        FROM tasks t CROSS JOIN generate_series(0, 1) k
+        WHERE t.title LIKE 'Plan task %%'
+        ON CONFLICT DO NOTHING
+    ''', (n_users,))
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS chat_participants (
-            id SERIAL PRIMARY KEY,
-            chat_id INTEGER REFERENCES chat_conversations(id) ON DELETE CASCADE,
-            username TEXT REFERENCES users(username) ON DELETE CASCADE,
-            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            UNIQUE(chat_id, username)
-        )
+        INSERT INTO task_attachments (task_id, filename, file_path, file_type, file_size)
+        SELECT id, 'plan.pdf', 'uploads/plan.pdf', 'pdf', 1024
+        FROM tasks WHERE title LIKE 'Plan task %' AND id % 2 = 0
     ''')
     
-    # Chats table for team communication (messages)
+    # One individual chat per user with the next user
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS chats (
-            id SERIAL PRIMARY KEY,
-            chat_id INTEGER REFERENCES chat_conversations(id) ON DELETE CASCADE,
-            sender_username TEXT REFERENCES users(username) ON DELETE SET NULL,
-            message TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
+        INSERT INTO chat_conversations (chat_name, chat_type)
+        SELECT 'plan_chat_' || g, 'individual' FROM generate_series(1, %s) g
+    ''', (n_users,))
+    cur.execute('''
+        INSERT INTO chat_participants (chat_id, username)
+        SELECT cc.id, 'plan_user_' || (1 + (substr(cc.chat_name, 11)::int + k) %% %s)
+        FROM chat_conversations cc CROSS JOIN generate_series(0, 1) k
+        WHERE cc.chat_name LIKE 'plan_chat_%%'
+        ON CONFLICT DO NOTHING
+    ''', (n_users,))
+    cur.execute('''
+        INSERT INTO chats (chat_id, sender_username, message, created_at)
+        SELECT cp.chat_id, cp.username, 'Plan message ' || g, NOW() - g * INTERVAL '1 second'
+        FROM (
+            SELECT chat_id, username, row_number() OVER (ORDER BY chat_id, username) AS rn
+            FROM chat_participants WHERE username LIKE 'plan_user_%%'
+        ) cp
+        JOIN generate_series(1, %s) g ON g %% (2 * %s) = cp.rn %% (2 * %s)
+    ''', (rows['chats'], n_users, n_users))
+    cur.execute('''
+        INSERT INTO chat_attachments (chat_message_id, filename, file_path, file_type, file_size)
+        SELECT id, 'plan.png', 'uploads/chat_attachments/plan.png', 'image', 2048
+        FROM chats WHERE message LIKE 'Plan message %' AND id % 10 = 0
     ''')
     
-    # Chat attachments table
+    # Most notices are archived; only a handful are active at any time
     cur.execute('''
-        CREATE TABLE IF NOT EXISTS chat_attachments (
-            id SERIAL PRIMARY KEY,
-            chat_message_id INTEGER REFERENCES chats(id) ON DELETE CASCADE,
-            filename TEXT NOT NULL,
-            file_path TEXT NOT NULL,
-            file_type TEXT NOT NULL,
-            file_size INTEGER,
-            uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            uploaded_by TEXT REFERENCES users(username) ON DELETE SET NULL
-        )
+        INSERT INTO notices (title, content, created_by, is_active, created_at)
+        SELECT 'Plan notice ' || g, 'Seeded by check-query-plans', 'plan_user_' || (1 + g %% %s),
+               g %% 50 = 0, NOW() - g * INTERVAL '1 hour'
+        FROM generate_series(1, %s) g
+    ''', (n_users, rows['notices']))
+    cur.execute('''
+        INSERT INTO notice_attachments (notice_id, filename, file_path, file_type, file_size)
+        SELECT id, 'plan.jpg', 'uploads/notices/plan.jpg', 'image', 4096
+        FROM notices WHERE title LIKE 'Plan notice %' AND id % 3 = 0
     ''')
     
-    # Create uploads directory if it doesn't exist
-    uploads_dir = "uploads"
-    if not os.path.exists(uploads_dir):
-        os.makedirs(uploads_dir)
-    
-    # Create chat attachments directory
-    chat_uploads_dir = os.path.join("uploads", "chat_attachments")
-    if not os.path.exists(chat_uploads_dir):
-        os.makedirs(chat_uploads_dir)
-    
-    # Clear old test messages to avoid rendering issues (only on first run)
-    # cur.execute('DELETE FROM chats')
-    # cur.execute('DELETE FROM chat_attachments')
-    
-    cur.execute('SELECT * FROM users WHERE username=%s', ('admin',))
-    if not cur.fetchone():
-        hashed_pw = bcrypt.hashpw('admin'.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-        cur.execute('''
-            INSERT INTO users (username, password, employee_id, first_name, last_name, department, designation, is_admin, is_director) 
-            VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE, FALSE)
-        ''', ('admin', hashed_pw, '000000000001', 'Admin', 'User', 'Administration', 'Administrator'))
-    
-    # Create default "ALL" chat conversation
-    cur.execute('SELECT * FROM chat_conversations WHERE chat_type=%s', ('all',))
-    if not cur.fetchone():
-        cur.execute('''
-            INSERT INTO chat_conversations (chat_name, chat_type, created_by)
-            VALUES (%s, %s, %s)
-            RETURNING id
-        ''', ('General Chat (All Users)', 'all', 'admin'))
-        all_chat_id = cur.fetchone()[0]
-        
-        # Add all existing users to "ALL" chat
-        cur.execute('SELECT username FROM users')
-        all_users = cur.fetchall()
-        for user_row in all_users:
-            cur.execute('''
-                INSERT INTO chat_participants (chat_id, username)
-                VALUES (%s, %s)
-                ON CONFLICT DO NOTHING
-            ''', (all_chat_id, user_row[0]))
+    for table in sorted(PLAN_CHECK_TABLES):
+        cur.execute(f'ANALYZE {table}')
+
+def _plan_check_samples(cur):
+    samples = {'username': 'plan_user_42', 'department': 'Plan Dept 7'}
+    cur.execute("SELECT task_id FROM task_assignments WHERE username = %s ORDER BY task_id", (samples['username'],))
+    samples['task_ids'] = [row[0] for row in cur.fetchall()]
+    samples['task_id'] = samples['task_ids'][0]
+    cur.execute("SELECT chat_id FROM chat_participants WHERE username = %s ORDER BY chat_id LIMIT 1", (samples['username'],))
+    samples['chat_id'] = cur.fetchone()[0]
+    cur.execute("SELECT id FROM chats WHERE chat_id = %s ORDER BY id DESC LIMIT 100", (samples['chat_id'],))
+    samples['message_ids'] = [row[0] for row in cur.fetchall()]
+    samples['message_id'] = samples['message_ids'][0]
+    cur.execute("SELECT created_at FROM chats WHERE id = %s", (samples['message_id'],))
+    samples['message_created_at'] = cur.fetchone()[0]
+    cur.execute("SELECT MAX(id) FROM notices WHERE title LIKE 'Plan notice %'")
+    samples['notice_id'] = cur.fetchone()[0]
+    cur.execute("SELECT priority_rank, created_at, id FROM tasks ORDER BY priority_rank, created_at DESC, id DESC OFFSET 200 LIMIT 1")
+    samples['task_cursor'] = tuple(cur.fetchone())
+    samples['due_from'] = date.today()
+    samples['due_to'] = date.today()
+    return samples
+
+def _find_seq_scans(plan):
+    found = []
+    if (plan.get('Node Type') == 'Seq Scan' and plan.get('Relation Name') in PLAN_CHECK_TABLES
+            and 'Filter' in plan):
+        found.append(plan['Relation Name'])
+    for child in plan.get('Plans', []):
+        found.extend(_find_seq_scans(child))
+    return found
+
+def check_query_plans(conn):
+    # Returns {query name: [tables read with a sequential scan]}; empty means all good
+    run_migrations(conn)
+    cur = conn.cursor()
+    failures = {}
+    try:
+        _seed_plan_check_data(cur)
+        samples = _plan_check_samples(cur)
+        for name, build_query in HOT_QUERIES.items():
+            sql, params = build_query(samples)
+            cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cur.fetchone()[0][0]['Plan']
+            seq_scans = _find_seq_scans(plan)
+            if seq_scans:
+                failures[name] = seq_scans
+    finally:
+        # Never keep the seed rows
+        conn.rollback()
+        cur.close()
+    return failures
+
+# Command-line maintenance tasks, e.g. `python task_manager.py check-query-plans`.
+# Under `streamlit run` a runtime exists and the app renders as usual.
+def run_cli(argv):
+    parser = argparse.ArgumentParser(prog="task_manager.py", description="SRJ Strips Task Manager maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    plans_parser = subparsers.add_parser("check-query-plans", help="fail if a hot query falls back to a sequential scan")
+    plans_parser.add_argument("--dsn", help="database to check (defaults to the configured database)")
+    
+    gc_parser = subparsers.add_parser("gc-uploads", help="reconcile uploads/ with the attachment tables")
+    gc_parser.add_argument("--dsn", help="database to use (defaults to the configured database)")
+    gc_parser.add_argument("--delete", action="store_true", help="delete orphans (default: only report them)")
+    gc_parser.add_argument("--grace-seconds", type=int, default=3600,
+                           help="leave files younger than this alone (uploads in flight)")
+    gc_parser.add_argument("--batch-size", type=int, default=500)
+    gc_parser.add_argument("--max-deletes-per-second", type=int, default=50, help="0 for no limit")
+    gc_parser.add_argument("--quiet", action="store_true", help="print only the summary")
+    
+    export_parser = subparsers.add_parser("export-worker", help="run queued export jobs")
+    export_parser.add_argument("--dsn", help="database to use (defaults to the configured database)")
+    export_parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between polls of an empty queue")
+    export_parser.add_argument("--once", action="store_true", help="run the jobs queued now, then exit")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "check-query-plans":
+        conn = psycopg2.connect(args.dsn) if args.dsn else get_db_connection()
+        try:
+            failures = check_query_plans(conn)
+        finally:
+            conn.close()
+        for name in HOT_QUERIES:
+            if name in failures:
+                print(f"FAIL  {name}: sequential scan on {', '.join(failures[name])}")
+            else:
+                print(f"ok    {name}")
+        return 1 if failures else 0
     
-    conn.commit()
-    cur.close()
-    conn.close()
+    if args.command == "gc-uploads":
+        conn = psycopg2.connect(args.dsn) if args.dsn else get_db_connection()
+        report = None if args.quiet else (lambda finding, detail: print(f"{finding}: {detail}"))
+        try:
+            run_migrations(conn)
+            counts = UploadGarbageCollector(conn, get_blob_storage(), delete=args.delete,
+                                            grace_seconds=args.grace_seconds,
+                                            batch_size=args.batch_size,
+                                            max_deletes_per_second=args.max_deletes_per_second,
+                                            report=report).collect()
+        finally:
+            conn.close()
+        print(f"{'Swept' if args.delete else 'Found (dry run, pass --delete to clean up)'}:")
+        for finding, count in sorted(counts.items()):
+            print(f"  {count:8d}  {finding}")
+        if not counts:
+            print("  nothing to do")
+        return 0
+    
+    if args.command == "export-worker":
+        connect = (lambda: psycopg2.connect(args.dsn)) if args.dsn else get_db_connection
+        conn = connect()
+        try:
+            run_migrations(conn)
+        finally:
+            conn.close()
+        worker = ExportWorker(connect, get_blob_storage(), poll_interval=args.poll_interval)
+        if args.once:
+            count = 0
+            while worker.run_once():
+                count += 1
+            purged = worker.purge_expired()
+            print(f"Ran {count} export job(s), purged {purged} expired")
+            return 0
+        print(f"Export worker {worker.name} polling every {args.poll_interval}s")
+        try:
+            worker.run_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+if __name__ == "__main__" and not st_runtime.exists():
+    sys.exit(run_cli(sys.argv[1:]))
+
+# Configure page for wide layout - FORCE SIDEBAR EXPANDED
+st.set_page_config(
+    page_title="SRJ Strips Task Manager",
+    layout="wide",
+    initial_sidebar_state="expanded",
+    menu_items=None  # Hide default Streamlit menu
+)
 
-# Initialize database only once
-if 'db_initialized' not in st.session_state:
-    init_db()
-    st.session_state.db_initialized = True
+ensure_schema()
 
 # Theme initialization
 if 'theme' not in st.session_state:
@@ -1007,9 +4206,13 @@ def task_page():
     cur = conn.cursor(cursor_factory=DictCursor)
     
     # Get user's department to check if HR
-    cur.execute('SELECT department FROM users WHERE username=%s', (user['username'],))
+    cur.execute(USER_DEPARTMENT_SQL, (user['username'],))
     user_dept = cur.fetchone()
     user_department = user_dept['department'] if user_dept else None
+    
+    # Return it before the sidebar: navigation and logout call st.rerun()
+    cur.close()
+    conn.close()
     is_hr = user_department and user_department.upper() == 'HR'
     can_add_notices = is_admin or is_hr or is_director
     
@@ -1545,28 +4748,33 @@ def task_page():
     # Set selected page
     selected_page = st.session_state.current_page
     
-    # Display selected page
-    if selected_page == "📋 Tasks":
-        show_tasks_page(conn, cur, user, is_admin)
-    elif selected_page == "👥 Users Management":
-        if is_admin or is_director:
-            show_users_management(conn, cur)
-    elif selected_page == "🏢 Departments & Designations":
-        if is_admin or is_director:
-            show_departments_designations(conn, cur)
-    elif selected_page == "📢 Notice Board":
-        show_notice_board(conn, cur, user, can_add_notices)
-    elif selected_page == "💬 Chat":
-        show_chat_box(conn, cur, user)
-    elif selected_page == "📊 Admin Dashboard" and is_admin:
-        show_admin_dashboard(conn, cur)
+    # Pages call st.rerun() (which raises) all over the place, so always
+    # hand the connection back to the pool in finally
+    conn = get_db_connection()
+    cur = conn.cursor(cursor_factory=DictCursor)
+    try:
+        # Display selected page
+        if selected_page == "📋 Tasks":
+            show_tasks_page(conn, cur, user, is_admin)
+        elif selected_page == "👥 Users Management":
+            if is_admin or is_director:
+                show_users_management(conn, cur)
+        elif selected_page == "🏢 Departments & Designations":
+            if is_admin or is_director:
+                show_departments_designations(conn, cur)
+        elif selected_page == "📢 Notice Board":
+            show_notice_board(conn, cur, user, can_add_notices)
+        elif selected_page == "💬 Chat":
+            show_chat_box(conn, cur, user)
+        elif selected_page == "📊 Admin Dashboard" and is_admin:
+            show_admin_dashboard(conn, cur, user)
+    finally:
+        cur.close()
+        conn.close()
     
     # Close main content wrapper
     st.markdown('</div>', unsafe_allow_html=True)
     
-    cur.close()
-    conn.close()
-    
     # Old tab-based navigation code (commented out for now)
     # if is_admin or is_director:
     #     if is_admin:
@@ -1891,12 +5099,7 @@ def show_chat_box(conn, cur, user):
         st.session_state.current_chat_id = all_chat['id'] if all_chat else None
     
     # Get all chats user is part of
-    cur.execute('''
-        SELECT cc.* FROM chat_conversations cc
-        INNER JOIN chat_participants cp ON cc.id = cp.chat_id
-        WHERE cp.username = %s
-        ORDER BY cc.chat_type, cc.created_at DESC
-    ''', (user['username'],))
+    cur.execute(USER_CHATS_SQL, (user['username'],))
     user_chats = cur.fetchall()
     
     # Chat selection and creation in main content (using columns)
@@ -2010,23 +5213,23 @@ def show_chat_box(conn, cur, user):
         # List of chats
         st.markdown("---")
         if user_chats:
+            today = datetime.now().date()
             for chat in user_chats:
                 chat_label = chat['chat_name'] if chat['chat_name'] else f"Chat #{chat['id']}"
-                if chat['chat_type'] == 'individual':
+                if chat['chat_type'] == 'individual' and chat['other_name']:
                     # For individual chats, show other participant's name
-                    cur.execute('''
-                        SELECT u.username FROM chat_participants cp
-                        JOIN users u ON cp.username = u.username
-                        WHERE cp.chat_id = %s AND cp.username != %s
-                        LIMIT 1
-                    ''', (chat['id'], user['username']))
-                    other_user = cur.fetchone()
-                    if other_user:
-                        chat_label = other_user['username']
+                    chat_label = chat['other_name']
+                
+                if chat['last_message_at']:
+                    last_time = chat['last_message_at']
+                    chat_label += f" · {last_time.strftime('%H:%M') if last_time.date() == today else last_time.strftime('%d %b')}"
                 
                 if st.button(f"📩 {chat_label}", key=f"chat_btn_{chat['id']}"):
                     st.session_state.current_chat_id = chat['id']
                     st.rerun()
+                if chat['last_message_at']:
+                    sender = "You" if chat['last_sender'] == user['username'] else (chat['last_sender'] or "Deleted user")
+                    st.caption(f"{sender}: {chat['last_message'] or '📎 Attachment'}")
     
     with col_chat_main:
         # Main chat area
@@ -2039,25 +5242,9 @@ def show_chat_box(conn, cur, user):
             if current_chat:
                 chat_name = current_chat['chat_name'] if current_chat['chat_name'] else f"Chat #{current_chat_id}"
                 
-                # Get messages for current chat
-                cur.execute('''
-                    SELECT c.*, u.first_name, u.last_name, u.department, u.designation
-                    FROM chats c
-                    LEFT JOIN users u ON c.sender_username = u.username
-                    WHERE c.chat_id = %s
-                    ORDER BY c.created_at DESC
-                    LIMIT 100
-                ''', (current_chat_id,))
-                messages = cur.fetchall()
-                messages.reverse()
-                
                 # Chat header
                 # Get chat participants for display
-                cur.execute('''
-                    SELECT u.username, u.first_name, u.last_name FROM chat_participants cp
-                    JOIN users u ON cp.username = u.username
-                    WHERE cp.chat_id = %s AND cp.username != %s
-                ''', (current_chat_id, user['username']))
+                cur.execute(CHAT_PARTICIPANTS_SQL, (current_chat_id, user['username']))
                 participants = cur.fetchall()
                 
                 if current_chat['chat_type'] == 'individual' and participants:
@@ -2124,54 +5311,17 @@ def show_chat_box(conn, cur, user):
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.button("Confirm", key=f"confirm_delete_{current_chat_id}", type="primary"):
+                            # Rows go in one statement; their files are unlinked in the background
                             if delete_option == "Delete from everyone":
-                                # Get all message IDs before deletion to delete files
-                                cur.execute('SELECT id FROM chats WHERE chat_id = %s', (current_chat_id,))
-                                message_ids = [row[0] for row in cur.fetchall()]
-                                
-                                # Delete associated attachments and files
-                                for msg_id in message_ids:
-                                    cur.execute('SELECT file_path FROM chat_attachments WHERE chat_message_id = %s', (msg_id,))
-                                    attachments = cur.fetchall()
-                                    for att in attachments:
-                                        file_path = att[0]
-                                        if os.path.exists(file_path):
-                                            try:
-                                                os.remove(file_path)
-                                            except Exception as e:
-                                                pass  # File already deleted or permission issue
-                                
-                                # Delete all messages from this chat (attachments will be deleted via CASCADE)
-                                cur.execute('DELETE FROM chats WHERE chat_id = %s', (current_chat_id,))
-                                conn.commit()
+                                blob_ids = clear_chat_messages(conn, cur, current_chat_id)
                                 st.success("All messages deleted from everyone!")
-                                st.session_state[f'clear_chat_dialog_{current_chat_id}'] = False
-                                st.rerun()
                             else:  # Delete from me
-                                # Get message IDs for user's messages to delete files
-                                cur.execute('SELECT id FROM chats WHERE chat_id = %s AND sender_username = %s', 
-                                          (current_chat_id, user['username']))
-                                message_ids = [row[0] for row in cur.fetchall()]
-                                
-                                # Delete associated attachments and files
-                                for msg_id in message_ids:
-                                    cur.execute('SELECT file_path FROM chat_attachments WHERE chat_message_id = %s', (msg_id,))
-                                    attachments = cur.fetchall()
-                                    for att in attachments:
-                                        file_path = att[0]
-                                        if os.path.exists(file_path):
-                                            try:
-                                                os.remove(file_path)
-                                            except Exception as e:
-                                                pass  # File already deleted or permission issue
-                                
-                                # Delete only messages sent by current user (attachments will be deleted via CASCADE)
-                                cur.execute('DELETE FROM chats WHERE chat_id = %s AND sender_username = %s', 
-                                          (current_chat_id, user['username']))
-                                conn.commit()
+                                # Delete only messages sent by current user
+                                blob_ids = clear_chat_messages(conn, cur, current_chat_id, sender=user['username'])
                                 st.success("Your messages deleted!")
-                                st.session_state[f'clear_chat_dialog_{current_chat_id}'] = False
-                                st.rerun()
+                            reclaim_blobs_later(blob_ids)
+                            st.session_state[f'clear_chat_dialog_{current_chat_id}'] = False
+                            st.rerun()
                     with col2:
                         if st.button("Cancel", key=f"cancel_delete_{current_chat_id}"):
                             st.session_state[f'clear_chat_dialog_{current_chat_id}'] = False
@@ -2185,108 +5335,9 @@ def show_chat_box(conn, cur, user):
                 # Chat wrapper for proper structure
                 st.markdown('<div class="chat-wrapper">', unsafe_allow_html=True)
                 
-                # Scrollable messages container - Fixed position
-                st.markdown(f'<div class="chat-messages-container">{join_link_html}', unsafe_allow_html=True)
-                
-                # Display messages in Telegram-like style
-                if messages:
-                    for msg in messages:
-                        # Get attachments for this message
-                        cur.execute('''
-                            SELECT * FROM chat_attachments
-                            WHERE chat_message_id = %s
-                        ''', (msg['id'],))
-                        attachments = cur.fetchall()
-                        
-                        is_own_message = msg['sender_username'] == user['username']
-                        sender_name = f"{msg['first_name']} {msg['last_name']}" if msg['first_name'] else msg['sender_username']
-                        timestamp = msg['created_at'].strftime('%H:%M') if msg['created_at'] else 'N/A'
-                        
-                        if is_own_message:
-                            # Right-aligned message (own) - Telegram style
-                            st.markdown(f'''
-                            <div class="telegram-message-own">
-                                <div class="telegram-message-own-content">
-                                    {msg['message'] or ''}
-                                    <div class="telegram-message-time">{timestamp} ✓</div>
-                                </div>
-                            </div>
-                            ''', unsafe_allow_html=True)
-                            
-                            # Display attachments separately below message
-                            if attachments:
-                                for att in attachments:
-                                    if att['file_type'] == 'image':
-                                        st.image(att['file_path'], width=250)
-                                    elif att['file_type'] == 'audio':
-                                        if os.path.exists(att['file_path']):
-                                            with open(att['file_path'], "rb") as audio_file:
-                                                st.audio(audio_file, format='audio/mpeg')
-                                    elif att['file_type'] == 'pdf':
-                                        if os.path.exists(att['file_path']):
-                                            with open(att['file_path'], "rb") as pdf_file:
-                                                st.download_button(
-                                                    label=f"📄 {att['filename']}",
-                                                    data=pdf_file,
-                                                    file_name=att['filename'],
-                                                    key=f"own_pdf_{msg['id']}_{att['id']}"
-                                                )
-                                    else:
-                                        if os.path.exists(att['file_path']):
-                                            with open(att['file_path'], "rb") as other_file:
-                                                st.download_button(
-                                                    label=f"📎 {att['filename']}",
-                                                    data=other_file,
-                                                    file_name=att['filename'],
-                                                    key=f"own_file_{msg['id']}_{att['id']}"
-                                                )
-                        else:
-                            # Left-aligned message (others) with avatar
-                            sender_initials = ''.join([n[0].upper() for n in sender_name.split()[:2]]) if sender_name else 'U'
-                            
-                            st.markdown(f'''
-                            <div class="telegram-message-other">
-                                <div class="telegram-avatar">{sender_initials}</div>
-                                <div class="telegram-message-other-content">
-                                    <div class="telegram-message-sender">{sender_name}</div>
-                                    {msg['message'] or ''}
-                                    <div class="telegram-message-time">{timestamp}</div>
-                                </div>
-                            </div>
-                            ''', unsafe_allow_html=True)
-                            
-                            # Display attachments separately below message
-                            if attachments:
-                                for att in attachments:
-                                    if att['file_type'] == 'image':
-                                        st.image(att['file_path'], width=250)
-                                    elif att['file_type'] == 'audio':
-                                        if os.path.exists(att['file_path']):
-                                            with open(att['file_path'], "rb") as audio_file:
-                                                st.audio(audio_file, format='audio/mpeg')
-                                    elif att['file_type'] == 'pdf':
-                                        if os.path.exists(att['file_path']):
-                                            with open(att['file_path'], "rb") as pdf_file:
-                                                st.download_button(
-                                                    label=f"📄 {att['filename']}",
-                                                    data=pdf_file,
-                                                    file_name=att['filename'],
-                                                    key=f"other_pdf_{msg['id']}_{att['id']}"
-                                                )
-                                    else:
-                                        if os.path.exists(att['file_path']):
-                                            with open(att['file_path'], "rb") as other_file:
-                                                st.download_button(
-                                                    label=f"📎 {att['filename']}",
-                                                    data=other_file,
-                                                    file_name=att['filename'],
-                                                    key=f"other_file_{msg['id']}_{att['id']}"
-                                                )
-                else:
-                    st.info("No messages yet. Start the conversation!")
-                
-                # Close scrollable messages container
-                st.markdown('</div>', unsafe_allow_html=True)
+                # Messages pane: refreshes itself when this chat changes
+                st.session_state.chat_pane_stale = True
+                show_chat_messages(dict(current_chat), user, join_link_html)
                 
                 # Message input - Fixed at bottom (inside wrapper)
                 # File uploaders outside form
@@ -2335,12 +5386,7 @@ def show_chat_box(conn, cur, user):
                         
                         # Handle file uploads
                         if uploaded_files:
-                            chat_uploads_dir = os.path.join("uploads", "chat_attachments")
-                            if not os.path.exists(chat_uploads_dir):
-                                os.makedirs(chat_uploads_dir)
-                            
                             for uploaded_file in uploaded_files:
-                                # Generate unique filename
                                 if hasattr(uploaded_file, 'name') and uploaded_file.name:
                                     file_extension = os.path.splitext(uploaded_file.name)[1]
                                     filename = uploaded_file.name
@@ -2349,12 +5395,8 @@ def show_chat_box(conn, cur, user):
                                     file_extension = '.wav'
                                     filename = 'voice_recording.wav'
                                 
-                                unique_filename = f"{uuid.uuid4()}{file_extension}"
-                                file_path = os.path.join(chat_uploads_dir, unique_filename)
-                                
-                                # Save file
-                                with open(file_path, "wb") as f:
-                                    f.write(uploaded_file.getbuffer())
+                                # Save file (stored once per distinct content)
+                                blob_sha256, file_path = store_upload(cur, uploaded_file)
                                 
                                 # Determine file type
                                 file_type = 'other'
@@ -2370,13 +5412,13 @@ def show_chat_box(conn, cur, user):
                                     file_type = 'excel'
                                 
                                 # Get file size
-                                file_size = uploaded_file.size if hasattr(uploaded_file, 'size') else os.path.getsize(file_path)
+                                file_size = uploaded_file.size if hasattr(uploaded_file, 'size') else len(uploaded_file.getbuffer())
                                 
                                 # Save to database
                                 cur.execute('''
-                                    INSERT INTO chat_attachments (chat_message_id, filename, file_path, file_type, file_size, uploaded_by)
-                                    VALUES (%s, %s, %s, %s, %s, %s)
-                                ''', (message_id, filename, file_path, file_type, file_size, user['username']))
+                                    INSERT INTO chat_attachments (chat_message_id, filename, file_path, file_type, file_size, uploaded_by, blob_sha256)
+                                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                                ''', (message_id, filename, file_path, file_type, file_size, user['username'], blob_sha256))
                         
                         conn.commit()
                         st.rerun()
@@ -2426,13 +5468,9 @@ def show_users_management(conn, cur):
                     except Exception as e:
                         st.error(f"Error creating director: {str(e)}")
     
-    # Get all users
-    cur.execute('''
-        SELECT username, employee_id, first_name, last_name, department, designation, is_admin, is_director
-        FROM users 
-        ORDER BY is_admin DESC, is_director DESC, first_name, last_name
-    ''')
-    all_users = cur.fetchall()
+    # Get all users with their task counts (one grouped query, cached until
+    # an assignment, a task status or a user changes)
+    all_users = load_users_with_task_counts(get_cache_version(cur, 'user_task_counts'))
     
     st.metric("Total Users", len(all_users))
     
@@ -2452,14 +5490,6 @@ def show_users_management(conn, cur):
         # Create DataFrame for table view
         users_data = []
         for u in filtered_users:
-            # Get task count for this user
-            cur.execute('''
-                SELECT COUNT(*) as task_count 
-                FROM task_assignments 
-                WHERE username = %s
-            ''', (u['username'],))
-            task_count = cur.fetchone()['task_count']
-            
             # Determine role
             if u.get('is_admin', False):
                 role = "Admin"
@@ -2475,7 +5505,9 @@ def show_users_management(conn, cur):
                 "Employee ID": u['employee_id'],
                 "Department": u['department'],
                 "Designation": u['designation'],
-                "Total Tasks": task_count,
+                "Open Tasks": u['open_tasks'],
+                "Completed Tasks": u['completed_tasks'],
+                "Total Tasks": u['total_tasks'],
                 "Is Director": "Yes" if u.get('is_director', False) else "No"
             })
         
@@ -2519,14 +5551,6 @@ def show_users_management(conn, cur):
             
             # Table rows with delete buttons
             for idx, u in enumerate(filtered_users):
-                # Get task count for this user
-                cur.execute('''
-                    SELECT COUNT(*) as task_count 
-                    FROM task_assignments 
-                    WHERE username = %s
-                ''', (u['username'],))
-                task_count = cur.fetchone()['task_count']
-                
                 # Determine role
                 if u.get('is_admin', False):
                     role = "Admin"
@@ -2551,7 +5575,7 @@ def show_users_management(conn, cur):
                 with col_row[5]:
                     st.write(u['designation'])
                 with col_row[6]:
-                    st.write(task_count)
+                    st.write(u['total_tasks'])
                 with col_row[7]:
                     st.write("Yes" if u.get('is_director', False) else "No")
                 with col_row[8]:
@@ -2620,14 +5644,8 @@ def show_users_management(conn, cur):
                     st.markdown(f"**Department:** {u['department']}")
                     st.markdown(f"**Designation:** {u['designation']}")
                 with col3:
-                    # Get task count for this user
-                    cur.execute('''
-                        SELECT COUNT(*) as task_count 
-                        FROM task_assignments 
-                        WHERE username = %s
-                    ''', (u['username'],))
-                    task_count = cur.fetchone()['task_count']
-                    st.metric("Total Tasks", task_count)
+                    st.metric("Total Tasks", u['total_tasks'])
+                    st.caption(f"{u['open_tasks']} open · {u['completed_tasks']} completed")
                 with col4:
                     # Director status toggle
                     is_current_director = u.get('is_director', False)
@@ -2661,14 +5679,7 @@ def show_users_management(conn, cur):
                                 st.error(f"Error deleting user: {str(e)}")
                 
                 # Show user's tasks
-                cur.execute('''
-                    SELECT t.* FROM tasks t
-                    INNER JOIN task_assignments ta ON t.id = ta.task_id
-                    WHERE ta.username = %s
-                    ORDER BY 
-                        CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
-                        t.created_at DESC
-                ''', (u['username'],))
+                cur.execute(USER_ASSIGNED_TASKS_SQL, (u['username'],))
                 user_tasks = cur.fetchall()
                 
                 # Show user's tasks in a better format
@@ -2882,21 +5893,11 @@ def show_notice_board(conn, cur, user, can_add_notices):
                             ''', (notice_title.strip(), notice_content.strip(), user['username'], is_active_notice))
                             notice_id = cur.fetchone()['id']
                             
-                            # Save attached files
+                            # Save attached files (stored once per distinct content)
                             if notice_files:
-                                uploads_dir = "uploads/notices"
-                                if not os.path.exists(uploads_dir):
-                                    os.makedirs(uploads_dir)
-                                
                                 for uploaded_file in notice_files:
-                                    # Generate unique filename
                                     file_extension = os.path.splitext(uploaded_file.name)[1]
-                                    unique_filename = f"{uuid.uuid4()}{file_extension}"
-                                    file_path = os.path.join(uploads_dir, unique_filename)
-                                    
-                                    # Save file to filesystem
-                                    with open(file_path, "wb") as f:
-                                        f.write(uploaded_file.getbuffer())
+                                    blob_sha256, file_path = store_upload(cur, uploaded_file)
                                     
                                     # Determine file type
                                     if file_extension.lower() in ['.jpg', '.jpeg', '.png', '.gif']:
@@ -2908,9 +5909,9 @@ def show_notice_board(conn, cur, user, can_add_notices):
                                     
                                     # Save file metadata to database
                                     cur.execute('''
-                                        INSERT INTO notice_attachments (notice_id, filename, file_path, file_type, file_size, uploaded_by)
-                                        VALUES (%s, %s, %s, %s, %s, %s)
-                                    ''', (notice_id, uploaded_file.name, file_path, file_type, uploaded_file.size, user['username']))
+                                        INSERT INTO notice_attachments (notice_id, filename, file_path, file_type, file_size, uploaded_by, blob_sha256)
+                                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                                    ''', (notice_id, uploaded_file.name, file_path, file_type, uploaded_file.size, user['username'], blob_sha256))
                             
                             conn.commit()
                             st.success(f"Notice '{notice_title}' published successfully!")
@@ -2932,13 +5933,7 @@ def show_notice_board(conn, cur, user, can_add_notices):
             ORDER BY n.created_at DESC
         ''')
     else:
-        cur.execute('''
-            SELECT n.*, u.first_name, u.last_name, u.department
-            FROM notices n
-            LEFT JOIN users u ON n.created_by = u.username
-            WHERE n.is_active = TRUE
-            ORDER BY n.created_at DESC
-        ''')
+        cur.execute(ACTIVE_NOTICES_SQL)
     
     notices = cur.fetchall()
     
@@ -2960,12 +5955,7 @@ def show_notice_board(conn, cur, user, can_add_notices):
             
             with st.container():
                 # Get attachments for this notice
-                cur.execute('''
-                    SELECT id, filename, file_path, file_type, file_size
-                    FROM notice_attachments
-                    WHERE notice_id=%s
-                    ORDER BY uploaded_at
-                ''', (notice['id'],))
+                cur.execute(NOTICE_ATTACHMENTS_SQL, (notice['id'],))
                 attachments = cur.fetchall()
                 
                 # Notice card with better contrast
@@ -2989,62 +5979,23 @@ def show_notice_board(conn, cur, user, can_add_notices):
                     st.markdown("---")
                     st.markdown("### 🎉 Special Attachments (Wishes/Occasions)")
                     for att in attachments:
-                        if att['file_type'] == 'image':
-                            # Display image with better styling
-                            file_path = att['file_path']
-                            # Check if path exists
-                            if os.path.exists(file_path):
-                                try:
-                                    st.markdown(f"**🖼️ Image: {att['filename']}**")
-                                    # Display image
-                                    st.image(file_path, caption=f"{att['filename']} - Wish/Occasion Image", width='stretch', clamp=True)
-                                    st.markdown("---")
-                                except Exception as e:
-                                    st.warning(f"⚠️ Could not display image: {att['filename']} - {str(e)}")
-                                    # Show download button as fallback
-                                    try:
-                                        with open(file_path, "rb") as file:
-                                            file_data = file.read()
-                                        st.download_button(
-                                            label=f"📥 Download Image: {att['filename']}",
-                                            data=file_data,
-                                            file_name=att['filename'],
-                                            key=f"notice_att_dl_{att['id']}",
-                                            mime="image/jpeg"
-                                        )
-                                    except Exception as e2:
-                                        st.error(f"Error loading file: {str(e2)}")
+                        key = f"notice_attachment_{att['id']}"
+                        if not att.get('blob_sha256'):
+                            st.warning(f"⚠️ File not found: {att['filename']}")
+                        elif att['file_type'] == 'image':
+                            st.markdown(f"**🖼️ Image: {att['filename']}**")
+                            # A downscaled copy; the original is fetched only on open
+                            medium = image_derivative_source(att, 'medium')
+                            if medium:
+                                st.image(medium, caption=f"{att['filename']} - Wish/Occasion Image", width='stretch')
                             else:
-                                st.warning(f"⚠️ Image file not found at path: {file_path}")
-                                st.info(f"Debug: File path = {file_path}, File type = {att['file_type']}, Filename = {att['filename']}")
+                                st.caption("Preparing preview…")
+                            show_attachment_download(att, "🔍 Open original", key)
+                            st.markdown("---")
                         elif att['file_type'] == 'pdf':
-                            # Show download link for PDFs
-                            if os.path.exists(att['file_path']):
-                                with open(att['file_path'], "rb") as file:
-                                    file_data = file.read()
-                                st.download_button(
-                                    label=f"📄 Download PDF: {att['filename']}",
-                                    data=file_data,
-                                    file_name=att['filename'],
-                                    key=f"notice_att_{att['id']}",
-                                    mime="application/pdf"
-                                )
-                            else:
-                                st.warning(f"⚠️ PDF file not found: {att['filename']}")
+                            show_attachment_download(att, f"📄 Download PDF: {att['filename']}", key)
                         else:
-                            # Other file types
-                            if os.path.exists(att['file_path']):
-                                with open(att['file_path'], "rb") as file:
-                                    file_data = file.read()
-                                st.download_button(
-                                    label=f"📎 Download {att['filename']}",
-                                    data=file_data,
-                                    file_name=att['filename'],
-                                    key=f"notice_att_{att['id']}",
-                                    mime=att['file_type']
-                                )
-                            else:
-                                st.warning(f"⚠️ File not found: {att['filename']} at {att['file_path']}")
+                            show_attachment_download(att, f"📎 Download {att['filename']}", key)
                 else:
                     # Debug: Show if no attachments found (for admin/HR only)
                     if can_add_notices:
@@ -3066,8 +6017,11 @@ def show_notice_board(conn, cur, user, can_add_notices):
                     with col2:
                         if st.button("🗑️ Delete", key=f"del_notice_{notice['id']}"):
                             try:
+                                cur.execute('SELECT DISTINCT blob_sha256 FROM notice_attachments WHERE notice_id=%s AND blob_sha256 IS NOT NULL', (notice['id'],))
+                                blob_ids = [row[0] for row in cur.fetchall()]
                                 cur.execute('DELETE FROM notices WHERE id=%s', (notice['id'],))
                                 conn.commit()
+                                reclaim_blobs_later(blob_ids)
                                 st.success("Notice deleted successfully!")
                                 st.rerun()
                             except Exception as e:
@@ -3103,8 +6057,9 @@ def show_notice_board(conn, cur, user, can_add_notices):
                 
                 st.divider()
 
-def show_admin_dashboard(conn, cur):
+def show_admin_dashboard(conn, cur, user):
     st.header("📊 Admin Dashboard - Complete Data View")
+    show_exports_panel(user)
     
     # Two sections: Directors Login Details and Tasks Details
     tab1, tab2 = st.tabs(["🎯 Directors Login Details", "📋 All Tasks Details"])
@@ -3113,12 +6068,7 @@ def show_admin_dashboard(conn, cur):
         st.subheader("🎯 Directors Login Details")
         
         # Get all directors
-        cur.execute('''
-            SELECT username, password, employee_id, first_name, last_name, department, designation, is_director
-            FROM users 
-            WHERE is_director = TRUE
-            ORDER BY first_name, last_name
-        ''')
+        cur.execute(DIRECTORS_SQL)
         directors = cur.fetchall()
         
         if not directors:
@@ -3126,99 +6076,30 @@ def show_admin_dashboard(conn, cur):
         else:
             st.metric("Total Directors", len(directors))
             
-            # Create table data
-            directors_data = []
-            for dir_user in directors:
-                directors_data.append({
-                    "Username": dir_user['username'],
-                    "Password Hash": dir_user['password'][:50] + "..." if len(dir_user['password']) > 50 else dir_user['password'],
-                    "Employee ID": dir_user['employee_id'],
-                    "First Name": dir_user['first_name'],
-                    "Last Name": dir_user['last_name'],
-                    "Department": dir_user['department'],
-                    "Designation": dir_user['designation']
-                })
-            
             # Display in table format
-            df_directors = pd.DataFrame(directors_data)
+            df_directors = pd.DataFrame([_director_export_row(dir_user) for dir_user in directors],
+                                        columns=[header for header, _ in DIRECTOR_EXPORT_COLUMNS])
             st.dataframe(df_directors, width='stretch', hide_index=True, height=600)
             
             # Export option
-            csv_directors = df_directors.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download Directors Data (CSV)",
-                data=csv_directors,
-                file_name=f"directors_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
+            show_export_download("📥 Export Directors Data", 'directors_export', "directors_data",
+                                 user, 'directors')
     
     with tab2:
         st.subheader("📋 All Tasks Details")
         
-        # Get all tasks with assigned users and attachments
-        cur.execute('''
-            SELECT 
-                t.id, t.title, t.desc, t.priority, t.status, 
-                t.created_at, t.due_date, t.completed_at
-            FROM tasks t
-            ORDER BY 
-                CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
-                t.created_at DESC
-        ''')
-        all_tasks = cur.fetchall()
+        # Shared overview query: one page of tasks with assignees and attachment counts
+        total_tasks = count_task_overview(cur, {})
         
-        if not all_tasks:
+        if total_tasks == 0:
             st.info("No tasks found in the system.")
         else:
-            st.metric("Total Tasks", len(all_tasks))
-            
-            # Create table data with assigned users
-            tasks_data = []
-            for task in all_tasks:
-                # Get assigned users for this task
-                cur.execute('''
-                    SELECT username, assigned_at 
-                    FROM task_assignments 
-                    WHERE task_id = %s
-                    ORDER BY assigned_at
-                ''', (task['id'],))
-                assigned_users_data = cur.fetchall()
-                assigned_users = ", ".join([f"{row['username']}" for row in assigned_users_data])
-                
-                # Get attachments count
-                cur.execute('SELECT COUNT(*) as count FROM task_attachments WHERE task_id = %s', (task['id'],))
-                attachments_count = cur.fetchone()['count']
-                
-                # Format dates
-                created_date = task['created_at'].strftime('%Y-%m-%d %H:%M') if task['created_at'] else 'N/A'
-                due_date = task['due_date'].strftime('%Y-%m-%d') if task['due_date'] else 'Not set'
-                completed_date = task['completed_at'].strftime('%Y-%m-%d %H:%M') if task['completed_at'] else 'Not completed'
-                
-                tasks_data.append({
-                    "Task ID": task['id'],
-                    "Title": task['title'],
-                    "Description": task['desc'] or 'No description',
-                    "Priority": task['priority'].upper(),
-                    "Status": task['status'].upper(),
-                    "Assigned To": assigned_users or 'Unassigned',
-                    "Created At": created_date,
-                    "Due Date": due_date,
-                    "Completed At": completed_date,
-                    "Attachments": attachments_count
-                })
-            
-            # Display in table format
-            df_tasks = pd.DataFrame(tasks_data)
-            st.dataframe(df_tasks, width='stretch', hide_index=True, height=600)
+            st.metric("Total Tasks", total_tasks)
+            show_task_overview_grid(cur, {}, 'admin_tasks_grid', total=total_tasks)
             
             # Export option
-            csv_tasks = df_tasks.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download Tasks Data (CSV)",
-                data=csv_tasks,
-                file_name=f"tasks_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
+            show_export_download("📥 Export Tasks Data", 'admin_tasks_export', "tasks_data",
+                                 user, 'tasks', {'filters': {}})
 
 def show_tasks_page(conn, cur, user, is_admin):
     
@@ -3231,7 +6112,7 @@ def show_tasks_page(conn, cur, user, is_admin):
     user_designation = user.get('designation', '')
     
     # Get current user's department from database
-    cur.execute('SELECT department FROM users WHERE username=%s', (user['username'],))
+    cur.execute(USER_DEPARTMENT_SQL, (user['username'],))
     user_dept_result = cur.fetchone()
     user_department = user_dept_result['department'] if user_dept_result else None
     
@@ -3290,21 +6171,11 @@ def show_tasks_page(conn, cur, user, is_admin):
                     (task_id, username)
                 )
             
-            # Save uploaded files
+            # Save uploaded files (stored once per distinct content)
             if uploaded_files:
-                uploads_dir = "uploads"
-                if not os.path.exists(uploads_dir):
-                    os.makedirs(uploads_dir)
-                
                 for uploaded_file in uploaded_files:
-                    # Generate unique filename
                     file_extension = os.path.splitext(uploaded_file.name)[1]
-                    unique_filename = f"{uuid.uuid4()}{file_extension}"
-                    file_path = os.path.join(uploads_dir, unique_filename)
-                    
-                    # Save file to filesystem
-                    with open(file_path, "wb") as f:
-                        f.write(uploaded_file.getbuffer())
+                    blob_sha256, file_path = store_upload(cur, uploaded_file)
                     
                     # Determine file type
                     file_type = uploaded_file.type if hasattr(uploaded_file, 'type') else 'application/octet-stream'
@@ -3319,9 +6190,9 @@ def show_tasks_page(conn, cur, user, is_admin):
                     
                     # Save file metadata to database
                     cur.execute('''
-                        INSERT INTO task_attachments (task_id, filename, file_path, file_type, file_size, uploaded_by)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    ''', (task_id, uploaded_file.name, file_path, file_type, uploaded_file.size, user['username']))
+                        INSERT INTO task_attachments (task_id, filename, file_path, file_type, file_size, uploaded_by, blob_sha256)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ''', (task_id, uploaded_file.name, file_path, file_type, uploaded_file.size, user['username'], blob_sha256))
             
             conn.commit()
             st.success("Task added!")
@@ -3355,156 +6226,129 @@ def show_tasks_page(conn, cur, user, is_admin):
                 key="bulk_import_file"
             )
             
+            if 'bulk_import_result' in st.session_state:
+                cur.execute('SELECT * FROM import_jobs WHERE id = %s', (st.session_state.pop('bulk_import_result'),))
+                job = cur.fetchone()
+                if job and job['created_count'] > 0:
+                    st.success(f"✅ Successfully imported {job['created_count']} task(s)!")
+                if job and (job['updated_count'] or job['unchanged_count']):
+                    st.info(f"🔁 {job['updated_count']} existing task(s) updated, "
+                            f"{job['unchanged_count']} already up to date")
+                if job and job['error_count']:
+                    st.error(f"❌ {job['error_count']} row(s) were not imported")
+                    errors = import_job_errors_frame(cur, job['id'])
+                    st.download_button("📥 Download error report", errors.to_csv(index=False).encode('utf-8'),
+                                       file_name="task_import_errors.csv", mime="text/csv",
+                                       key="bulk_import_result_errors_csv")
+            
             if bulk_file:
                 try:
-                    # Read file based on extension
-                    if bulk_file.name.endswith('.csv'):
-                        df = pd.read_csv(bulk_file)
-                    else:
-                        df = pd.read_excel(bulk_file)
-                    
-                    # Display preview
+                    # Display preview (first rows only; the import streams the file)
+                    preview = next(iter_import_chunks(bulk_file, chunk_size=10), pd.DataFrame())
                     st.markdown("**Preview of uploaded data:**")
-                    st.dataframe(df.head(10), width='stretch')
+                    st.dataframe(preview, width='stretch')
                     
-                    if st.button("Import All Tasks", key="bulk_import_btn"):
-                        success_count = 0
-                        error_count = 0
-                        errors = []
-                        
-                        for idx, row in df.iterrows():
-                            try:
-                                # Parse row data (handle missing columns)
-                                task_title = str(row.iloc[0]) if len(row) > 0 else None
-                                task_desc = str(row.iloc[1]) if len(row) > 1 and pd.notna(row.iloc[1]) else None
-                                task_priority = str(row.iloc[2]).lower() if len(row) > 2 and pd.notna(row.iloc[2]) else 'medium'
-                                task_status = str(row.iloc[3]).lower() if len(row) > 3 and pd.notna(row.iloc[3]) else 'pending'
-                                task_due_date = pd.to_datetime(row.iloc[4]).date() if len(row) > 4 and pd.notna(row.iloc[4]) else None
-                                assigned_str = str(row.iloc[5]) if len(row) > 5 else None
-                                
-                                # Validation
-                                if not task_title or task_title.lower() in ['nan', 'none', '']:
-                                    error_count += 1
-                                    errors.append(f"Row {idx+2}: Missing title")
-                                    continue
-                                
-                                if not assigned_str or assigned_str.lower() in ['nan', 'none', '']:
-                                    error_count += 1
-                                    errors.append(f"Row {idx+2}: Missing assigned users")
-                                    continue
-                                
-                                # Split assigned users by comma
-                                assigned_usernames = [u.strip() for u in assigned_str.split(',')]
-                                
-                                # Validate users exist
-                                cur.execute('SELECT username FROM users WHERE username = ANY(%s)', (assigned_usernames,))
-                                valid_users = [row['username'] for row in cur.fetchall()]
-                                
-                                if not valid_users:
-                                    error_count += 1
-                                    errors.append(f"Row {idx+2}: No valid users found")
-                                    continue
-                                
-                                # Validate priority and status
-                                if task_priority not in ['low', 'medium', 'high', 'urgent']:
-                                    task_priority = 'medium'
-                                
-                                if task_status not in ['pending', 'due', 'completed']:
-                                    task_status = 'pending'
-                                
-                                # Create task
-                                completed_at_value = datetime.now() if task_status == 'completed' else None
-                                
-                                cur.execute(
-                                    'INSERT INTO tasks (title, "desc", priority, status, due_date, completed_at) VALUES (%s, %s, %s, %s, %s, %s) RETURNING id',
-                                    (task_title, task_desc, task_priority, task_status, task_due_date, completed_at_value)
-                                )
-                                task_id = cur.fetchone()['id']
-                                
-                                # Assign to users
-                                for username in valid_users:
-                                    cur.execute(
-                                        'INSERT INTO task_assignments (task_id, username) VALUES (%s, %s)',
-                                        (task_id, username)
-                                    )
-                                
-                                success_count += 1
-                                
-                            except Exception as e:
-                                error_count += 1
-                                errors.append(f"Row {idx+2}: {str(e)}")
-                        
-                        # Commit all transactions
-                        conn.commit()
-                        
-                        # Display results
-                        if success_count > 0:
-                            st.success(f"✅ Successfully imported {success_count} task(s)!")
-                        if error_count > 0:
-                            st.error(f"❌ Failed to import {error_count} task(s)")
-                            with st.expander("View Import Errors"):
-                                for err in errors:
-                                    st.text(err)
-                        
-                        # Rerun to show new tasks
-                        if success_count > 0:
+                    # An earlier run of the same file by this user that did not finish
+                    file_sha256 = hashlib.sha256(bulk_file.getbuffer()).hexdigest()
+                    cur.execute('''
+                        SELECT * FROM import_jobs WHERE created_by = %s AND file_sha256 = %s
+                        ORDER BY id DESC LIMIT 1
+                    ''', (user['username'], file_sha256))
+                    job = cur.fetchone()
+                    st.caption("Rows are validated and imported in chunks of "
+                               f"{TASK_IMPORT_CHUNK_SIZE}; rows with problems are skipped and listed in the error report.")
+                    
+                    job_id = None
+                    if job and job['status'] != 'completed':
+                        st.warning(f"An earlier import of this file stopped after {job['rows_done']} row(s)"
+                                   + (f": {job['last_error']}" if job['last_error'] else "."))
+                        if st.button("Resume Import", key="bulk_import_resume_btn"):
+                            job_id = job['id']
+                    elif job:
+                        st.info(f"This file was already imported on {job['updated_at']:%Y-%m-%d %H:%M} "
+                                f"({job['created_count']} task(s)). Importing it again only updates "
+                                "priority and status of those tasks.")
+                    if st.button("Import Tasks", key="bulk_import_btn"):
+                        job_id = start_import_job(conn, bulk_file, file_sha256, user['username'])
+                    
+                    if job_id:
+                        progress_bar = st.progress(0.0, text="Importing tasks...")
+                        def show_progress(rows_done, total_rows):
+                            fraction = min(rows_done / total_rows, 1.0) if total_rows else 0.0
+                            progress_bar.progress(fraction, text=f"Imported {rows_done} of {total_rows or '?'} row(s)")
+                        if run_import_job(conn, job_id, bulk_file, show_progress):
+                            # Shown after the rerun below, which brings in the new tasks
+                            st.session_state.bulk_import_result = job_id
                             st.rerun()
+                        else:
+                            st.warning("This import is already running in another session.")
                 
                 except Exception as e:
-                    st.error(f"Error reading file: {str(e)}")
-                    st.info("Please check if your file is in the correct format and try again.")
+                    st.error(f"Error importing file: {str(e)}")
+                    st.info("Please check if your file is in the correct format and try again. "
+                            "Rows imported so far are kept; use Resume Import to continue.")
     
     st.header("Task List")
     
-    # Filter options
-    filter_col1, filter_col2 = st.columns(2)
+    # Filter options (applied in SQL)
+    is_director = user.get('is_director', False)
+    can_see_all_tasks = is_admin or is_director
+    filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
     with filter_col1:
         filter_priority = st.selectbox("Filter by Priority", ['All', 'low', 'medium', 'high', 'urgent'], key='filter_priority')
     with filter_col2:
         filter_status = st.selectbox("Filter by Status", ['All', 'pending', 'due', 'completed'], key='filter_status')
-    
-    # Build query based on user role
-    is_director = user.get('is_director', False)
-    if is_admin or is_director:
-        query = '''
-            SELECT t.* FROM tasks t
-            ORDER BY 
-                CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
-                t.created_at DESC
-        '''
-        params = ()
+    with filter_col3:
+        filter_due_from = st.date_input("Due From", value=None, key='filter_due_from')
+    with filter_col4:
+        filter_due_to = st.date_input("Due To", value=None, key='filter_due_to')
+    
+    filter_assignee = 'All'
+    filter_department = 'All'
+    if can_see_all_tasks:
+        filter_col5, filter_col6, filter_col7 = st.columns([2, 2, 1])
+        with filter_col5:
+            filter_assignee = st.selectbox("Filter by Assignee", ['All'] + all_users, key='filter_assignee')
+        with filter_col6:
+            cur.execute('SELECT name FROM departments ORDER BY name')
+            departments_list = [row['name'] for row in cur.fetchall()]
+            filter_department = st.selectbox("Filter by Department", ['All'] + departments_list, key='filter_department')
+        with filter_col7:
+            page_size = st.selectbox("Tasks per page", TASK_PAGE_SIZES, index=1, key='task_page_size')
     else:
-        # Use subquery to avoid DISTINCT + ORDER BY issue
-        query = '''
-            SELECT t.* FROM tasks t
-            WHERE t.id IN (
-                SELECT DISTINCT task_id FROM task_assignments WHERE username = %s
-            )
-            ORDER BY 
-                CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
-                t.created_at DESC
-        '''
-        params = (user['username'],)
+        page_size = st.selectbox("Tasks per page", TASK_PAGE_SIZES, index=1, key='task_page_size')
+    
+    task_filters = {
+        'priority': filter_priority if filter_priority != 'All' else None,
+        'status': filter_status if filter_status != 'All' else None,
+        'due_from': filter_due_from,
+        'due_to': filter_due_to,
+        'assignee': filter_assignee if filter_assignee != 'All' else None,
+        'department': filter_department if filter_department != 'All' else None,
+    }
     
-    cur.execute(query, params)
-    tasks = cur.fetchall()
+    # Cursors of the pages visited so far; start over whenever the filters change
+    filter_signature = (tuple(sorted(task_filters.items())), page_size)
+    if st.session_state.get('task_list_filter_signature') != filter_signature:
+        st.session_state.task_list_filter_signature = filter_signature
+        st.session_state.task_list_cursors = [None]
+    page_cursors = st.session_state.task_list_cursors
     
-    # Apply filters
-    filtered_tasks = []
-    for t in tasks:
-        if filter_priority != 'All' and t['priority'] != filter_priority:
-            continue
-        if filter_status != 'All' and t['status'] != filter_status:
-            continue
-        filtered_tasks.append(t)
+    # Admins and directors see every task, everyone else only their own
+    filtered_tasks, next_cursor = fetch_task_page(
+        cur, task_filters, page_cursors[-1], page_size,
+        visible_to=None if can_see_all_tasks else user['username']
+    )
     
     if not filtered_tasks:
         st.info("No tasks found.")
     else:
+        # Assignees and attachments for every listed task, loaded up front
+        assignees_by_task, attachments_by_task = load_task_details(cur, [t['id'] for t in filtered_tasks])
+        
         for t in filtered_tasks:
-            # Get assigned users with assigned_at dates for this task
-            cur.execute('SELECT username, assigned_at FROM task_assignments WHERE task_id=%s ORDER BY assigned_at', (t['id'],))
-            assigned_data = cur.fetchall()
+            # Assigned users with assigned_at dates for this task
+            assigned_data = assignees_by_task.get(t['id'], [])
             assigned_users = [row['username'] for row in assigned_data]
             
             # Priority color coding
@@ -3581,13 +6425,7 @@ def show_tasks_page(conn, cur, user, is_admin):
                     st.markdown(f"**{t['title']}**  \n{t['desc'] or ''}  \n👥 *Assigned to: {assigned_info}*{due_date_text}{completed_at_text}")
                     
                     # Display attached files
-                    cur.execute('''
-                        SELECT id, filename, file_path, file_type, file_size, uploaded_at, uploaded_by
-                        FROM task_attachments
-                        WHERE task_id=%s
-                        ORDER BY uploaded_at DESC
-                    ''', (t['id'],))
-                    attachments = cur.fetchall()
+                    attachments = attachments_by_task.get(t['id'], [])
                     
                     if attachments:
                         st.markdown("**📎 Attachments:**")
@@ -3605,22 +6443,13 @@ def show_tasks_page(conn, cur, user, is_admin):
                             }
                             file_icon = file_icons.get(att['file_type'], '📎')
                             
-                            # Read file for download
-                            if os.path.exists(att['file_path']):
-                                with open(att['file_path'], "rb") as file:
-                                    file_data = file.read()
-                                
+                            # The file is read only when it is downloaded
+                            if att.get('blob_sha256'):
                                 col_file1, col_file2 = st.columns([3, 1])
                                 with col_file1:
                                     st.markdown(f"{file_icon} {att['filename']} ({file_size_str})")
                                 with col_file2:
-                                    st.download_button(
-                                        label="Download",
-                                        data=file_data,
-                                        file_name=att['filename'],
-                                        key=f"download_{att['id']}",
-                                        mime=att['file_type']
-                                    )
+                                    show_attachment_download(att, "Download", f"task_attachment_{att['id']}")
                             else:
                                 st.warning(f"⚠️ File not found: {att['filename']}")
                 
@@ -3637,17 +6466,35 @@ def show_tasks_page(conn, cur, user, is_admin):
                 
                 with col4:
                     if st.button("🗑️ Delete", key=f"del_{t['id']}"):
+                        cur.execute("SELECT DISTINCT blob_sha256 FROM task_attachments WHERE task_id=%s AND blob_sha256 IS NOT NULL", (t['id'],))
+                        blob_ids = [row[0] for row in cur.fetchall()]
                         cur.execute("DELETE FROM tasks WHERE id=%s", (t['id'],))
                         conn.commit()
+                        reclaim_blobs_later(blob_ids)
                         st.rerun()
                 
                 st.divider()
     
+    # Page navigation
+    if len(page_cursors) > 1 or next_cursor is not None:
+        nav_col1, nav_col2, nav_col3 = st.columns([1, 2, 1])
+        with nav_col1:
+            if st.button("◀ Previous", key="task_page_prev", disabled=len(page_cursors) == 1):
+                page_cursors.pop()
+                st.rerun()
+        with nav_col2:
+            st.markdown(f"Page {len(page_cursors)}")
+        with nav_col3:
+            if st.button("Next ▶", key="task_page_next", disabled=next_cursor is None):
+                page_cursors.append(next_cursor)
+                st.rerun()
+    
     # Task Overview Table for Directors and Admins
     is_director = user.get('is_director', False)
     if is_admin or is_director:
         st.markdown("---")
         st.header("📊 Complete Task Overview Table")
+        show_exports_panel(user)
         
         # Export filters
         st.subheader("📅 Export Filters")
@@ -3665,91 +6512,16 @@ def show_tasks_page(conn, cur, user, is_admin):
                 all_users_list = [row[0] for row in cur.fetchall()]
                 export_username = st.selectbox("Select User", all_users_list, key='export_user')
         
-        # Get all tasks with details
-        query = '''
-            SELECT t.*, COUNT(DISTINCT ta.username) as assigned_count
-            FROM tasks t
-            LEFT JOIN task_assignments ta ON t.id = ta.task_id
-            WHERE 1=1
-        '''
-        params = []
-        
-        # Apply date filters
+        overview_filters = {}
         if export_filter_type == 'Daily':
-            query += ' AND DATE(t.created_at) = %s'
-            params.append(export_date)
+            overview_filters['created_on'] = export_date
         elif export_filter_type == 'Monthly':
-            query += ' AND DATE_TRUNC(\'month\', t.created_at) = DATE_TRUNC(\'month\', %s::timestamp)'
-            params.append(export_month)
-        
-        # Get users for user-wise filtering
-        if export_filter_type == 'User Wise':
-            query = '''
-                SELECT t.*, COUNT(DISTINCT ta.username) as assigned_count
-                FROM tasks t
-                INNER JOIN task_assignments ta ON t.id = ta.task_id
-                WHERE ta.username = %s
-                GROUP BY t.id
-            '''
-            params = [export_username]
-        else:
-            query += ' GROUP BY t.id'
-        
-        query += '''
-            ORDER BY 
-                CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
-                t.created_at DESC
-        '''
+            overview_filters['created_month'] = export_month
+        elif export_filter_type == 'User Wise':
+            overview_filters['assignee'] = export_username
         
-        cur.execute(query, params)
-        all_tasks_overview = cur.fetchall()
-        
-        if all_tasks_overview:
-            # Create detailed data for table
-            table_data = []
-            for task in all_tasks_overview:
-                # Get assigned users with their designations
-                cur.execute('''
-                    SELECT u.username, u.designation, u.department, ta.assigned_at
-                    FROM task_assignments ta
-                    JOIN users u ON ta.username = u.username
-                    WHERE ta.task_id = %s
-                    ORDER BY ta.assigned_at
-                ''', (task['id'],))
-                assigned_users = cur.fetchall()
-                
-                # Get attachments count
-                cur.execute('SELECT COUNT(*) as count FROM task_attachments WHERE task_id = %s', (task['id'],))
-                attachments_count = cur.fetchone()['count']
-                
-                # Format assigned users
-                assigned_info = []
-                for u in assigned_users:
-                    assigned_info.append(f"{u['username']} ({u['designation']})")
-                
-                # Format dates
-                created_date = task['created_at'].strftime('%Y-%m-%d %H:%M') if task['created_at'] else 'N/A'
-                due_date = task['due_date'].strftime('%Y-%m-%d') if task['due_date'] else 'Not set'
-                completed_date = task['completed_at'].strftime('%Y-%m-%d %H:%M') if task['completed_at'] else 'Not completed'
-                
-                table_data.append({
-                    "ID": task['id'],
-                    "Title": task['title'],
-                    "Description": (task['desc'][:50] + '...') if task['desc'] and len(task['desc']) > 50 else (task['desc'] or 'No description'),
-                    "Priority": task['priority'].upper(),
-                    "Status": task['status'].upper(),
-                    "Assigned To": ", ".join(assigned_info) if assigned_info else "Unassigned",
-                    "Created": created_date,
-                    "Due Date": due_date,
-                    "Completed": completed_date,
-                    "Attachments": attachments_count
-                })
-            
-            # Display in DataFrame
-            df_overview = pd.DataFrame(table_data)
-            st.dataframe(df_overview, width='stretch', hide_index=True, height=600)
-            
-            # Export option - CSV format
+        if show_task_overview_grid(cur, overview_filters, 'task_overview_grid'):
+            # Export option - CSV, Excel or Parquet
             # Determine filename based on filter
             filter_suffix = ""
             if export_filter_type == 'Daily':
@@ -3759,13 +6531,8 @@ def show_tasks_page(conn, cur, user, is_admin):
             elif export_filter_type == 'User Wise':
                 filter_suffix = f"_user_{export_username}"
             
-            csv_overview = df_overview.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Download Task Overview (CSV)",
-                data=csv_overview,
-                file_name=f"task_overview{filter_suffix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv"
-            )
+            show_export_download("📥 Export Task Overview", 'task_overview_export', f"task_overview{filter_suffix}",
+                                 user, 'tasks', {'filters': overview_filters})
         else:
             st.info("No tasks available for overview.")
     
@@ -3773,82 +6540,20 @@ def show_tasks_page(conn, cur, user, is_admin):
     elif user_designation == 'HOD':
         st.markdown("---")
         st.header("📊 My Department Tasks Overview")
+        show_exports_panel(user)
         
         # Get current user's department
-        cur.execute('SELECT department FROM users WHERE username=%s', (user['username'],))
+        cur.execute(USER_DEPARTMENT_SQL, (user['username'],))
         user_dept_result = cur.fetchone()
         user_dept = user_dept_result['department'] if user_dept_result else None
         
         if user_dept:
-            # Get tasks assigned to users in HOD's department
-            cur.execute('''
-                SELECT t.*
-                FROM tasks t
-                WHERE t.id IN (
-                    SELECT DISTINCT ta.task_id
-                    FROM task_assignments ta
-                    INNER JOIN users u ON ta.username = u.username
-                    WHERE u.department = %s
-                )
-                ORDER BY 
-                    CASE t.priority WHEN 'urgent' THEN 1 WHEN 'high' THEN 2 WHEN 'medium' THEN 3 WHEN 'low' THEN 4 END,
-                    t.created_at DESC
-            ''', (user_dept,))
-            dept_tasks = cur.fetchall()
-            
-            if dept_tasks:
-                # Create detailed data for table
-                table_data = []
-                for task in dept_tasks:
-                    # Get assigned users with their designations
-                    cur.execute('''
-                        SELECT u.username, u.designation, u.department, ta.assigned_at
-                        FROM task_assignments ta
-                        JOIN users u ON ta.username = u.username
-                        WHERE ta.task_id = %s AND u.department = %s
-                        ORDER BY ta.assigned_at
-                    ''', (task['id'], user_dept))
-                    assigned_users = cur.fetchall()
-                    
-                    # Get attachments count
-                    cur.execute('SELECT COUNT(*) as count FROM task_attachments WHERE task_id = %s', (task['id'],))
-                    attachments_count = cur.fetchone()['count']
-                    
-                    # Format assigned users
-                    assigned_info = []
-                    for u in assigned_users:
-                        assigned_info.append(f"{u['username']} ({u['designation']})")
-                    
-                    # Format dates
-                    created_date = task['created_at'].strftime('%Y-%m-%d %H:%M') if task['created_at'] else 'N/A'
-                    due_date = task['due_date'].strftime('%Y-%m-%d') if task['due_date'] else 'Not set'
-                    completed_date = task['completed_at'].strftime('%Y-%m-%d %H:%M') if task['completed_at'] else 'Not completed'
-                    
-                    table_data.append({
-                        "ID": task['id'],
-                        "Title": task['title'],
-                        "Description": (task['desc'][:50] + '...') if task['desc'] and len(task['desc']) > 50 else (task['desc'] or 'No description'),
-                        "Priority": task['priority'].upper(),
-                        "Status": task['status'].upper(),
-                        "Assigned To": ", ".join(assigned_info) if assigned_info else "Unassigned",
-                        "Created": created_date,
-                        "Due Date": due_date,
-                        "Completed": completed_date,
-                        "Attachments": attachments_count
-                    })
-                
-                # Display in DataFrame
-                df_dept = pd.DataFrame(table_data)
-                st.dataframe(df_dept, width='stretch', hide_index=True, height=600)
-                
+            # Tasks assigned to users in HOD's department, listing only those assignees
+            dept_filters = {'department': user_dept}
+            if show_task_overview_grid(cur, dept_filters, 'dept_overview_grid'):
                 # Export option
-                csv_dept = df_dept.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="📥 Download Department Tasks (CSV)",
-                    data=csv_dept,
-                    file_name=f"dept_tasks_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                    mime="text/csv"
-                )
+                show_export_download("📥 Export Department Tasks", 'dept_tasks_export', "dept_tasks",
+                                     user, 'tasks', {'filters': dept_filters})
             else:
                 st.info(f"No tasks found in {user_dept} department.")
 